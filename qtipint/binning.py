@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+binning: Averaging of TOAs within time bins
+
+TOAs are grouped by MJD bin, and optionally by frequency band or by the value
+of a flag. The grouping is a single sort: afterwards, TOAs of the same group
+are contiguous, and every per-group weighted mean is one np.add.reduceat.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Numpy etc.
+import numpy as np
+
+
+class TOABins(object):
+    """
+    Groups of TOAs that are averaged together. The TOAs in the groups, sorted
+    by group, are in order; group k consists of
+    order[starts[k]:starts[k]+counts[k]]. TOAs are weighted by 1/error^2
+    """
+
+    def __init__(self, mjd, error, binsize, keys=(), mask=None):
+        """
+        @param mjd:     Site arrival times of the TOAs (MJD)
+        @param error:   TOA uncertainties
+        @param binsize: Width of the time bins (days)
+        @param keys:    Sequence of per-TOA arrays; TOAs are only grouped
+                        together when these are equal as well
+        @param mask:    Boolean array of the TOAs to use, or None for all
+        """
+        if binsize <= 0:
+            raise ValueError("Bin size must be positive")
+        mjd = np.asarray(mjd, dtype=np.float64)
+        error = np.asarray(error, dtype=np.float64)
+        self.ntoas = len(mjd)
+
+        idx = np.arange(self.ntoas) if mask is None else np.flatnonzero(mask)
+        tbin = np.zeros(len(idx), dtype=np.int64)
+        if len(idx) > 0:
+            tbin = np.floor((mjd[idx] - mjd[idx].min()) / binsize).astype(np.int64)
+        groupkeys = [tbin] + [np.asarray(k)[idx] for k in keys]
+
+        # np.lexsort sorts on the last key first
+        srt = np.lexsort(groupkeys[::-1])
+        self.order = idx[srt]
+
+        change = np.zeros(len(srt), dtype=bool)
+        change[:1] = True
+        for key in groupkeys:
+            skey = key[srt]
+            change[1:] |= skey[1:] != skey[:-1]
+        self.starts = np.flatnonzero(change)
+        self.counts = np.diff(np.r_[self.starts, len(srt)])
+
+        self.weights = 1.0 / error[self.order]**2
+        self.wsum = np.add.reduceat(self.weights, self.starts) \
+                if len(srt) > 0 else np.zeros(0)
+        self.error = 1.0 / np.sqrt(self.wsum)
+
+        # Group of every TOA (-1 for TOAs that are not used)
+        self.group = np.full(self.ntoas, -1, dtype=np.int64)
+        self.group[self.order] = np.repeat(np.arange(len(self.starts)), self.counts)
+
+    @property
+    def nbins(self):
+        return len(self.starts)
+
+    @property
+    def first(self):
+        '''Index of the first TOA of every group'''
+        return self.order[self.starts]
+
+    def reduce(self, values):
+        """
+        Return the weighted mean of values over every group
+
+        @param values:  (ntoas,) or (ntoas, k) array
+        """
+        v = np.asarray(values, dtype=np.float64)[self.order]
+        w = self.weights if v.ndim == 1 else self.weights[:,None]
+        wsum = self.wsum if v.ndim == 1 else self.wsum[:,None]
+        if len(v) == 0:
+            return v
+        return np.add.reduceat(w * v, self.starts, axis=0) / wsum
+
+def binned_fit(bins, M, r):
+    """
+    Weighted least-squares fit on the binned TOAs. The design matrix and the
+    residuals are averaged like the TOAs, so this is a linearised fit on the
+    reduced data set. M and r must be in the units of the TOA errors
+
+    @param bins:    The TOABins
+    @param M:       (ntoas, nfit) design matrix
+    @param r:       The residuals
+
+    @return:    dx, errors of dx, chi2 of the binned residuals after the fit
+    """
+    Mb, rb = bins.reduce(M), bins.reduce(r)
+    sw = np.sqrt(bins.wsum)
+    Mw = Mb * sw[:,None]
+    norm = np.sqrt(np.sum(Mw**2, axis=0))
+    norm[norm == 0] = 1.0
+    Mw /= norm
+
+    dx, res, rank, sv = np.linalg.lstsq(Mw, sw * rb, rcond=None)
+    cov = np.linalg.pinv(np.dot(Mw.T, Mw))
+    dx /= norm
+    errs = np.sqrt(np.diag(cov)) / norm
+    chi2 = np.sum(bins.wsum * (rb - np.dot(Mb, dx))**2)
+    return dx, errs, chi2
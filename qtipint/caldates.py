@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+caldates: Conversion of MJDs to calendar years and days of the year
+
+astropy.time converts element by element through ERFA, which is slow for the
+large TOA arrays of the 'year' and 'day of year' axes. In the (proleptic)
+Gregorian calendar, the number of days before 1 January of a year is a
+closed integer expression in the number of leap years before it, so all
+conversions here are a handful of vectorised integer operations.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Numpy etc.
+import numpy as np
+
+
+# Days from 1 January of year 1 to MJD 0 (17 November 1858)
+_MJD_YEAR1 = 678575
+
+def year_start(year):
+    """
+    Return the MJD of 1 January of the given years
+
+    @param year:    Integer array of (Gregorian) years
+    """
+    y = np.asarray(year, dtype=np.int64) - 1
+    return 365 * y + y // 4 - y // 100 + y // 400 - _MJD_YEAR1
+
+def mjd_year(mjd):
+    """
+    Return the calendar year of every MJD
+
+    @param mjd:     Array of MJDs
+    """
+    day = np.floor(np.asarray(mjd, dtype=np.float64)).astype(np.int64)
+
+    # 146097 days in 400 years. The estimate is at most one year off
+    year = (400 * (day + _MJD_YEAR1)) // 146097 + 1
+    year += year_start(year + 1) <= day
+    year -= year_start(year) > day
+    return year
+
+def calendar(mjd):
+    """
+    Convert MJDs to the decimal year and the day of the year, in one pass
+
+    @param mjd:     Array of MJDs
+
+    @return:    decimal year, day of the year (days since 1 January 0h, so
+                starting from 0)
+    """
+    mjd = np.asarray(mjd, dtype=np.float64)
+    year = mjd_year(mjd)
+    start = year_start(year)
+    ndays = year_start(year + 1) - start
+
+    dayofyear = mjd - start
+    return year + dayofyear / ndays, dayofyear
+
+def decimal_year(mjd):
+    """
+    Return the decimal year of every MJD
+    """
+    return calendar(mjd)[0]
+
+def day_of_year(mjd):
+    """
+    Return the day of the year of every MJD (days since 1 January 0h)
+    """
+    return calendar(mjd)[1]
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+cholesky: Factorisation and solution of the normal equations of a fit
+
+The normal matrix of a timing fit is column-normalised (unit diagonal), and
+usually positive definite, so a Cholesky factor is the cheap way to solve it,
+and to update it when TOAs are deleted or restored. When parameters are
+degenerate (for instance a JUMP of which all TOAs are deleted) the matrix is
+singular, and the Cholesky factorisation fails. The fit then falls back on a
+pseudo-inverse from the eigen-decomposition, with a cutoff on small
+eigenvalues, like the SVD of pint.fitter.WlsFitter.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Numpy etc.
+import numpy as np
+import scipy.linalg as sl
+
+
+def cholupdate(R, x, sign=1.0, rcond=1e-12):
+    """
+    Rank-1 update (sign=1) or downdate (sign=-1) of an upper-triangular
+    Cholesky factor: returns R' with R'^T R' = R^T R + sign x x^T
+
+    @param R:       Upper-triangular Cholesky factor
+    @param x:       The update vector
+    @param sign:    1 for an update, -1 for a downdate
+    @param rcond:   A downdate that reduces a squared diagonal element of R
+                    by more than this fraction fails
+
+    @return:    The new factor, or None if a downdate made the matrix
+                (nearly) singular
+    """
+    R = R.copy()
+    x = np.array(x, dtype=np.float64)
+    for k in range(len(x)):
+        r2 = R[k,k]**2 + sign * x[k]**2
+        if r2 <= rcond * R[k,k]**2:
+            return None
+        r = np.sqrt(r2)
+        c, s = r / R[k,k], x[k] / R[k,k]
+        R[k,k] = r
+        R[k,k+1:] = (R[k,k+1:] + sign * s * x[k+1:]) / c
+        x[k+1:] = c * x[k+1:] - s * R[k,k+1:]
+    return R
+
+def factorise(A, rcond=1e-12):
+    """
+    Factorise a column-normalised normal matrix
+
+    @param A:       Symmetric, positive semi-definite matrix
+    @param rcond:   Cutoff on the eigenvalues, relative to the largest
+
+    @return:    (R, None) with R the upper-triangular Cholesky factor, or
+                (None, (V, winv, degenerate)) for a singular matrix: a
+                boolean array of the degenerate (unconstrained) columns, and
+                the eigenvectors and inverse eigenvalues that are kept of
+                the normal matrix of the other columns
+    """
+    try:
+        R = sl.cholesky(A, lower=False)
+        d = np.diag(R)**2
+        if np.min(d) > rcond * np.max(d):
+            return R, None
+    except np.linalg.LinAlgError:
+        pass
+
+    # A column that lies mostly in the null space is not constrained
+    w, V = np.linalg.eigh(A)
+    null = w <= rcond * max(np.max(w), 0.0)
+    degenerate = np.sum(V[:,null]**2, axis=1) > 0.5
+
+    # Pseudo-inverse of the normal matrix of the other columns
+    good = ~degenerate
+    w, V = np.linalg.eigh(A[np.ix_(good, good)])
+    keep = w > rcond * max(np.max(w), 0.0) if len(w) > 0 else w > 0
+    return None, (V[:,keep], 1.0 / w[keep], degenerate)
+
+def solve(factor, b):
+    """
+    Solve the normal equations A x = b, and invert A
+
+    @param factor:  The factorisation of A, from factorise
+    @param b:       The right-hand side
+
+    @return:    x, A^-1. For a singular A, the pseudo-inverse is used, and
+                the solution and the (co)variances of the degenerate columns
+                are zero
+    """
+    R, pinv = factor
+    if R is not None:
+        x = sl.cho_solve((R, False), b)
+        Ainv = sl.cho_solve((R, False), np.eye(len(x)))
+        return x, Ainv
+
+    V, winv, degenerate = pinv
+    good = ~degenerate
+    Ainv = np.zeros((len(b), len(b)))
+    Ainv[np.ix_(good, good)] = np.dot(V * winv, V.T)
+    x = np.dot(Ainv, b)
+    return x, Ainv
+
+def degenerate_columns(factor):
+    """
+    Return the boolean array of degenerate columns of a factorisation
+    """
+    R, pinv = factor
+    if R is not None:
+        return np.zeros(len(R), dtype=bool)
+    return pinv[2]
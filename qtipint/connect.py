@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+connect: Search for phase-connected solutions across gaps in the TOAs
+
+Across every gap, the pulse number may be off by an integer. The search walks
+the gaps in time order, and extends every partial solution with every
+allowed offset at the next gap. A partial solution is scored with the
+linearised chi^2 of the TOAs up to the next gap, with the fitted parameters
+projected out: chi^2 is quadratic in the offsets, so a whole generation of
+candidates is scored in one numpy expression. Only the best candidates (a
+beam) survive to the next gap. The survivors are finally fitted with the full
+nonlinear model, in parallel.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Numpy etc.
+import numpy as np
+
+import scan
+
+
+def find_gaps(mjds, mingap):
+    """
+    Find the gaps in a set of TOAs
+
+    @param mjds:    Site arrival times of the TOAs (MJD)
+    @param mingap:  Minimum length of a gap (days)
+
+    @return:    MJDs of the first TOA after every gap
+    """
+    smjds = np.sort(mjds)
+    after = np.flatnonzero(np.diff(smjds) > mingap) + 1
+    return smjds[after]
+
+def phase_connect(psr, gaps=None, mingap=10.0, maxjump=2, beam=20, \
+        maxdchi2=100.0, processes=None, maxiter=2):
+    """
+    Search over integer pulse number offsets at the gaps in the TOAs
+
+    @param psr:         The Pulsar object
+    @param gaps:        MJDs at which to try offsets (default: the first TOA
+                        after every gap longer than mingap)
+    @param mingap:      Minimum length of a gap (days)
+    @param maxjump:     Offsets from -maxjump to maxjump are tried at every gap
+    @param beam:        Maximum number of partial solutions kept per gap
+    @param maxdchi2:    Partial solutions with a linearised chi^2 more than
+                        this above the best one are dropped
+    @param processes:   Number of worker processes (default: all cores)
+    @param maxiter:     Maximum number of iterations of every final fit
+
+    @return:    List of (jumps, linearised chi2, chi2), best first. jumps is a
+                list of (MJD, offset) pairs, one for every gap
+    """
+    fitter = psr._fitter
+    model = fitter.model
+    mjds = psr.stoas.value
+    keep = np.logical_not(psr.deleted)
+
+    if gaps is None:
+        gaps = find_gaps(mjds[keep], mingap)
+    gaps = np.sort(np.asarray(gaps, dtype=np.float64))
+    if len(gaps) == 0:
+        print("WARNING: no gaps to connect across")
+        return []
+
+    # Effect of an offset of one pulse at every gap on the residuals
+    F0 = np.float64(model.F0.value)
+    gapindex = np.searchsorted(gaps, mjds, side='right')
+    J = (gapindex[:,None] > np.arange(len(gaps))[None,:]) / F0
+
+    M, names, units = fitter.dmcache.designmatrix(model, fitter.fitparams)
+    r = fitter.residuals()
+    steps = np.arange(-maxjump, maxjump+1)
+
+    # Beam search over the gaps, scored on the TOAs up to the next gap
+    cands = np.zeros((1, 0), dtype=int)
+    for ii in range(len(gaps)):
+        rows = (gapindex <= ii+1).astype(np.float64)
+        a, b, Q = scan.linearised_chi2(fitter, M * rows[:,None], \
+                J[:,:ii+1] * rows[:,None], r * rows)
+
+        cands = np.column_stack([np.repeat(cands, len(steps), axis=0), \
+                np.tile(steps, len(cands))])
+        chi2 = a + 2 * np.dot(cands, b) + np.einsum('ij,jk,ik->i', cands, Q, cands)
+
+        order = np.argsort(chi2, kind='mergesort')[:beam]
+        order = order[chi2[order] <= chi2[order[0]] + maxdchi2]
+        cands, linchi2 = cands[order], chi2[order]
+
+    # Full fits of the survivors
+    scan._share(fitter, gapindex=gapindex)
+    tasks = [((), maxiter, (), tuple(int(j) for j in cand)) for cand in cands]
+    results = scan.map_fits(tasks, processes)
+
+    solutions = [([(float(g), int(j)) for g, j in zip(gaps, cand)], lc, res[1]) \
+            for cand, lc, res in zip(cands, linchi2, results)]
+    solutions.sort(key=lambda sol: (np.isnan(sol[2]), sol[2]))
+    return solutions
@@ -0,0 +1,153 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+decimate: Level-of-detail decimation of scatter plots with many points
+
+When there are many more points than pixel columns, drawing them all only
+costs time: per pixel column, all we can see is the lowest and the highest
+point, plus the odd outlier. The DecimationPyramid is built once over the
+points sorted along x, and then answers 'which points to draw for this x-range
+at this resolution' in a time that depends on the number of pixel columns,
+not on the number of points.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Numpy etc.
+import numpy as np
+
+
+class DecimationPyramid(object):
+    """
+    Multi-resolution summary of a set of points, sorted along x. Level k of
+    the pyramid divides the sorted points in blocks of 2**k points, and stores
+    which point of each block reaches lowest and which highest (including the
+    error bars, if given). Level k is built from level k-1 by comparing pairs
+    of blocks.
+
+    Points further than nsigma robust standard deviations from the median are
+    outliers, and are always kept.
+    """
+
+    def __init__(self, x, y, yerr=None, nsigma=5.0):
+        """
+        @param x:       x-coordinates of the points
+        @param y:       y-coordinates of the points
+        @param yerr:    Error bars on y, or None
+        @param nsigma:  Outlier threshold, in robust standard deviations
+        """
+        self.order = np.argsort(x, kind='mergesort')
+        self.x = np.asarray(x)[self.order]
+        self.y = np.asarray(y)[self.order]
+        self.npoints = len(self.x)
+
+        # The lowest and highest extent of each point
+        if yerr is None:
+            self.ylow = self.yhigh = self.y
+        else:
+            yerr = np.asarray(yerr)[self.order]
+            self.ylow, self.yhigh = self.y - yerr, self.y + yerr
+
+        # Level 0: every point is its own block
+        self.imin = [np.arange(self.npoints)]
+        self.imax = [np.arange(self.npoints)]
+        while len(self.imin[-1]) > 1:
+            lmin, lmax = self.imin[-1], self.imax[-1]
+            if len(lmin) % 2 == 1:
+                lmin = np.append(lmin, lmin[-1])
+                lmax = np.append(lmax, lmax[-1])
+            amin, bmin = lmin[0::2], lmin[1::2]
+            amax, bmax = lmax[0::2], lmax[1::2]
+            self.imin.append(np.where(self.ylow[bmin] < self.ylow[amin], bmin, amin))
+            self.imax.append(np.where(self.yhigh[bmax] > self.yhigh[amax], bmax, amax))
+
+        # Outliers, as positions in the sorted arrays
+        med = np.median(self.y) if self.npoints > 0 else 0.0
+        mad = 1.4826 * np.median(np.abs(self.y - med)) if self.npoints > 0 else 0.0
+        if mad > 0:
+            self.outliers = np.flatnonzero(np.abs(self.y - med) > nsigma * mad)
+        else:
+            self.outliers = np.zeros(0, dtype=int)
+
+    def query(self, xmin, xmax, ncols, always=None):
+        """
+        Select the points to draw in the x-range [xmin, xmax], when that range
+        spans ncols pixel columns. Per pixel column, the lowest and highest
+        point are selected, as well as all outliers.
+
+        @param xmin:    Lower limit of the visible x-range
+        @param xmax:    Upper limit of the visible x-range
+        @param ncols:   Number of pixel columns of the visible x-range
+        @param always:  Indices (into the original arrays) of points that
+                        should always be selected
+
+        @return:    Sorted indices into the original x and y arrays
+        """
+        ncols = max(int(ncols), 1)
+        i0 = np.searchsorted(self.x, xmin, side='left')
+        i1 = np.searchsorted(self.x, xmax, side='right')
+        npts = i1 - i0
+
+        if npts <= 2 * ncols:
+            sel = np.arange(i0, i1)
+        else:
+            # Start from blocks of about a quarter of the points per column
+            level = int(np.floor(np.log2(max(npts / (4.0 * ncols), 1.0))))
+            level = min(level, len(self.imin)-1)
+            cand = self._candidates(i0, i1, xmin, xmax, ncols, level)
+
+            # Lowest and highest reaching candidate per pixel column
+            col = self._column(cand, xmin, xmax, ncols)
+            low = cand[np.lexsort((self.ylow[cand], col))]
+            high = cand[np.lexsort((-self.yhigh[cand], col))]
+            scol = np.sort(col)
+            first = np.flatnonzero(np.r_[True, scol[1:] != scol[:-1]])
+            sel = np.concatenate([low[first], high[first]])
+
+        outl = self.outliers[np.searchsorted(self.outliers, i0): \
+                np.searchsorted(self.outliers, i1)]
+        sel = np.concatenate([self.order[sel], self.order[outl]])
+        if always is not None:
+            sel = np.concatenate([sel, np.asarray(always, dtype=int)])
+
+        return np.unique(sel)
+
+    def _column(self, pos, xmin, xmax, ncols):
+        """
+        Pixel column of the points at positions pos of the sorted arrays
+        """
+        col = np.floor((self.x[pos] - xmin) / (xmax - xmin) * ncols)
+        return np.clip(col, 0, ncols-1).astype(int)
+
+    def _candidates(self, i0, i1, xmin, xmax, ncols, level):
+        """
+        Return the lowest and highest point of a set of blocks that exactly
+        cover the sorted points i0 to i1, with every block inside a single
+        pixel column. Starting from blocks of 2**level points, the blocks
+        that cross a column edge or the range edges are split in two, down to
+        single points. At most a few blocks per column edge are split on every
+        level, so the work does not grow with the number of points.
+        """
+        bsize = 2**level
+        blocks = np.arange(i0 // bsize, (i1 - 1) // bsize + 1)
+        cand = []
+        while len(blocks) > 0:
+            start = blocks * bsize
+            end = np.minimum(start + bsize, self.npoints) - 1
+            whole = (start >= i0) & (end < i1) & (self._column(start, \
+                    xmin, xmax, ncols) == self._column(end, xmin, xmax, ncols))
+            cand += [self.imin[level][blocks[whole]], \
+                    self.imax[level][blocks[whole]]]
+
+            # Split the other blocks that overlap the range
+            split = blocks[~whole & (end >= i0) & (start < i1)]
+            if level == 0:
+                break
+            level -= 1
+            bsize //= 2
+            blocks = np.concatenate([2*split, 2*split+1])
+            blocks = np.sort(blocks[blocks < len(self.imin[level])])
+        return np.concatenate(cand)
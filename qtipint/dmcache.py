@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+dmcache: Column-wise cache of the design matrix of a PINT timing model
+
+Every column of the design matrix costs a PINT derivative evaluation, and all
+of them need the delay of the model. The cache computes the delay once per
+model parameter vector, and every column only when it is first asked for, so
+that switching a parameter on or off costs at most one column.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Numpy etc.
+import numpy as np
+import astropy.units as u
+
+
+def model_values(model):
+    """
+    Return a tuple of the values of all model parameters
+    """
+    return tuple(getattr(model, p).value for p in model.params)
+
+class DesignMatrixCache(object):
+    """
+    Cache of the design matrix columns of one TOA set. The columns are valid
+    for one parameter vector of the model: when any parameter value changes,
+    all columns are thrown away. Like pint's designmatrix with scale_by_F0,
+    columns are in seconds per parameter unit, with the sign such that
+    p_new = p + M^+ r.
+    """
+
+    def __init__(self, toas):
+        """
+        @param toas:    The PINT TOAs object
+        """
+        self.toas = toas
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Throw away all cached columns
+        """
+        self._state = None
+        self._delay = None
+        self._columns = {}
+        self._units = {}
+        self._assembled = None
+
+    def _check(self, model):
+        """
+        Invalidate the cache if the model parameters have changed
+        """
+        state = model_values(model)
+        if state != self._state:
+            self.invalidate()
+            self._state = state
+
+    def column(self, model, param):
+        """
+        Return a design matrix column, and its unit
+
+        @param model:   The timing model to linearise
+        @param param:   Name of the parameter (or 'Offset')
+        """
+        self._check(model)
+        if param not in self._columns:
+            if param == 'Offset':
+                col = np.ones(self.toas.ntoas)
+                unit = u.s / u.s
+            else:
+                if self._delay is None:
+                    self._delay = model.delay(self.toas)
+                F0 = model.F0.quantity.to(u.Hz).value
+                q = model.d_phase_d_param(self.toas, self._delay, param)
+                col = -np.asarray(getattr(q, 'value', q), dtype=np.float64) / F0
+                unit = u.s / getattr(model, param).units
+            col.flags.writeable = False
+            self._columns[param] = col
+            self._units[param] = unit
+        return self._columns[param], self._units[param]
+
+    def designmatrix(self, model, params, incoffset=True):
+        """
+        Return the design matrix for a set of parameters
+
+        @param model:       The timing model to linearise
+        @param params:      Names of the parameters of the columns
+        @param incoffset:   Whether to prepend an 'Offset' column
+
+        @return:    M, params, units
+        """
+        self._check(model)
+        params = (['Offset'] if incoffset else []) + list(params)
+        if self._assembled is not None and self._assembled[1] == params:
+            return self._assembled
+
+        cols, units = zip(*[self.column(model, p) for p in params]) \
+                if len(params) > 0 else ([], [])
+        M = np.column_stack(cols) if len(cols) > 0 \
+                else np.zeros((self.toas.ntoas, 0))
+        M.flags.writeable = False
+        self._assembled = (M, params, list(units))
+        return self._assembled
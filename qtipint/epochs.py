@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+epochs: Grouping of TOAs into observations
+
+TOAs from the same observation share an observatory (and backend), and follow
+each other closely in time. The EpochIndex clusters the TOAs on gaps in the
+sorted site arrival times, separately per observatory/backend, and numbers
+the observations chronologically. Like a CSR matrix, the grouping is stored as
+the TOA indices sorted by observation, plus the offset of every observation
+in that array, so per-observation statistics are single np.ufunc.reduceat
+calls.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Numpy etc.
+import numpy as np
+
+
+class EpochIndex(object):
+    """
+    Index of the observations in a TOA set. Observation k consists of the TOAs
+    order[offsets[k]:offsets[k+1]], sorted by time; epoch[i] is the
+    observation of TOA i. Observations are numbered by their first TOA
+    """
+
+    def __init__(self, mjd, keys=(), maxgap=0.5):
+        """
+        @param mjd:     Site arrival times of the TOAs (MJD)
+        @param keys:    Sequence of per-TOA arrays (observatory, backend);
+                        TOAs with different keys are never in the same
+                        observation
+        @param maxgap:  Largest gap between TOAs of one observation (days)
+        """
+        self.mjd = np.asarray(mjd, dtype=np.float64)
+        self.ntoas = len(self.mjd)
+        keys = [np.unique(np.asarray(k), return_inverse=True)[1] for k in keys]
+
+        # Sort on the keys first, then on time
+        srt = np.lexsort([self.mjd] + keys[::-1])
+        smjd = self.mjd[srt]
+        new = np.zeros(self.ntoas, dtype=bool)
+        new[:1] = True
+        new[1:] = np.diff(smjd) > maxgap
+        for key in keys:
+            skey = key[srt]
+            new[1:] |= skey[1:] != skey[:-1]
+        group = np.cumsum(new) - 1
+
+        # Number the observations chronologically
+        rank = np.empty(int(new.sum()), dtype=np.int64)
+        rank[np.argsort(smjd[new], kind='mergesort')] = np.arange(len(rank))
+        sgroup = rank[group]
+
+        self.epoch = np.empty(self.ntoas, dtype=np.int64)
+        self.epoch[srt] = sgroup
+        perm = np.argsort(sgroup, kind='mergesort')
+        self.order = srt[perm]
+        counts = np.bincount(sgroup, minlength=len(rank))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    @property
+    def nepochs(self):
+        return len(self.offsets) - 1
+
+    @property
+    def counts(self):
+        '''Number of TOAs in every observation'''
+        return np.diff(self.offsets)
+
+    @property
+    def first(self):
+        '''Index of the first TOA of every observation'''
+        return self.order[self.offsets[:-1]]
+
+    @property
+    def last(self):
+        '''Index of the last TOA of every observation'''
+        return self.order[self.offsets[1:]-1]
+
+    def reduce(self, values, ufunc=np.add):
+        """
+        Reduce values over every observation with a ufunc (add, minimum, ...)
+
+        @param values:  (ntoas,) or (ntoas, k) array
+        """
+        v = np.asarray(values)[self.order]
+        if len(v) == 0:
+            return v
+        return ufunc.reduceat(v, self.offsets[:-1], axis=0)
+
+    def mean(self, values, weights=None):
+        """
+        Return the (weighted) mean of values over every observation
+        """
+        if weights is None:
+            return self.reduce(values) / self.counts
+        return self.reduce(np.asarray(values) * weights) / self.reduce(weights)
+
+    def polyline(self, indices, x, y):
+        """
+        Join points of the same observation by lines: return the coordinates
+        in observation and time order, with NaNs between observations
+
+        @param indices: Sorted TOA indices of the points
+        @param x:       x-coordinates of the points
+        @param y:       y-coordinates of the points
+
+        @return:    x, y of the polyline
+        """
+        indices = np.asarray(indices)
+        pos = np.full(self.ntoas, -1, dtype=np.int64)
+        pos[indices] = np.arange(len(indices))
+        seq = pos[self.order]
+        seq = seq[seq >= 0]
+
+        ep = self.epoch[indices[seq]]
+        breaks = np.flatnonzero(ep[1:] != ep[:-1]) + 1
+        lx = np.insert(np.asarray(x, dtype=np.float64)[seq], breaks, np.nan)
+        ly = np.insert(np.asarray(y, dtype=np.float64)[seq], breaks, np.nan)
+        return lx, ly
@@ -0,0 +1,387 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+fitting: Incremental (generalised) least-squares fitting of PINT timing models
+
+pint.fitter.WlsFitter starts from scratch on every fit: it copies the model,
+computes the residuals and the design matrix, and factorises. In an
+interactive session most fits differ little from the previous one, so the
+IncrementalFitter keeps its linearisation (design matrix, weights, and the
+Cholesky factor of the normal equations) between fits, and only redoes the
+parts that a change invalidates.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+import copy
+
+# Numpy etc.
+import numpy as np
+import astropy.units as u
+
+import pint.residuals
+
+from dmcache import DesignMatrixCache
+import cholesky
+from gls import noise_covariance
+
+
+# Parameters that are never fitted. Like in tempo2, their fit flag switches
+# on the zoom range of plk
+nofitpars = ['START', 'FINISH']
+
+def model_fingerprint(model):
+    """
+    Return a tuple of the values, and a tuple of the fit flags, of all model
+    parameters that affect the fit. Used to detect changes to a model that
+    were made behind our back
+    """
+    params = [p for p in model.params if p not in nofitpars]
+    values = tuple(getattr(model, p).value for p in params)
+    frozen = tuple(getattr(model, p).frozen for p in params)
+    return values, frozen
+
+def _set_uncertainty(par, err):
+    """
+    Set the uncertainty of a parameter from a Quantity
+    """
+    try:
+        unit = par.uncertainty.unit if par.uncertainty is not None else par.units
+        par.uncertainty = err.to(unit)
+    except (AttributeError, TypeError, u.UnitsError):
+        par.uncertainty_value = err.to(par.units).value
+
+class IncrementalFitter(object):
+    """
+    Least-squares fitter that keeps its linearisation between fits.
+    Like pint.fitter.WlsFitter, the post-fit model is in 'model' and the
+    post-fit residuals in 'resids', and model_init is the pre-fit model.
+
+    The linearisation consists of the design matrix columns of the fitted
+    parameters (at the model they were computed for), and the Cholesky factor
+    of the column-normalised, weighted normal equations. Toggling a fit flag
+    off only drops a column and refactorises the (small) normal matrix.
+    Deleting or restoring a few TOAs is a low-rank change of the normal
+    equations, which is applied to the Cholesky factor with rank-1 updates.
+    Iterations of a fit re-use the design matrix (a chord Gauss-Newton
+    iteration), and the design matrix is only recomputed when an iteration
+    fails to decrease the chi^2. Degenerate parameters make the normal
+    matrix singular: the fit then uses a pseudo-inverse (see cholesky.py), and
+    leaves those parameters alone.
+
+    In 'wls' mode the TOAs are weighted by their uncertainties. In 'gls' mode
+    the full noise covariance of the model (EFAC/EQUAD, ECORR, red noise) is
+    used, through a NoiseCovariance that is built once per model and mask.
+    """
+
+    def __init__(self, toas, model, dmcache=None):
+        """
+        @param toas:    The PINT TOAs object
+        @param model:   The pre-fit timing model
+        @param dmcache: DesignMatrixCache of the TOAs to share, or None
+        """
+        self.toas = toas
+        self.model_init = model
+        self.dmcache = DesignMatrixCache(toas) if dmcache is None else dmcache
+
+        self.sigma = toas.get_errors().to(u.s).value
+        self.deleted = np.zeros(len(self.sigma), dtype=bool)
+        self.weights = 1.0 / self.sigma**2
+        self.pulse_offsets = np.zeros(len(self.sigma))
+        self.mode = 'wls'
+
+        self.reset_model()
+
+    def reset_model(self):
+        """
+        Start again from the pre-fit model
+        """
+        self.model = copy.deepcopy(self.model_init)
+        self.init_fingerprint = model_fingerprint(self.model_init)
+        self.resids = pint.residuals.resids(self.toas, self.model)
+        self.covariance = None
+        self.niter = 0
+        self.converged = False
+        self.invalidate()
+
+    def model_init_changed(self):
+        """
+        Whether the pre-fit model was changed since the last reset
+        """
+        return model_fingerprint(self.model_init) != self.init_fingerprint
+
+    def invalidate(self):
+        """
+        Throw away the linearisation
+        """
+        self._columns = {}
+        self._units = {}
+        self._params = None
+        self._cho = None
+        self._fresh = False
+        self._noisebase = None
+        self._noise = None
+
+    @property
+    def ntoas(self):
+        '''Number of TOAs that are not deleted'''
+        return len(self.deleted) - np.count_nonzero(self.deleted)
+
+    @property
+    def fitparams(self):
+        '''Names of the parameters that are fitted, in model order'''
+        return [p for p in self.model.params \
+                if not getattr(self.model, p).frozen and p not in nofitpars]
+
+    def residuals(self):
+        """
+        Return the current post-fit residuals (s), with the pulse number
+        offsets of the phase jumps applied
+        """
+        r = self.resids.time_resids.to(u.s).value
+        if np.any(self.pulse_offsets):
+            # Like the PINT residuals, keep the weighted mean at zero
+            dr = self.pulse_offsets / np.float64(self.model.F0.value)
+            r = r + dr - np.sum(self.weights * dr) / np.sum(self.weights)
+        return r
+
+    def set_pulse_offsets(self, offsets):
+        """
+        Set the pulse number offset (phase jumps) of every TOA. The design
+        matrix does not depend on these, so the linearisation is kept
+
+        @param offsets: Offset of every TOA, in pulse periods
+        """
+        self.pulse_offsets = np.array(offsets, dtype=np.float64)
+
+    @property
+    def chi2(self):
+        '''Chi^2 of the current post-fit residuals'''
+        r = self.residuals()
+        return np.dot(r, self.cinv(r))
+
+    def set_mode(self, mode):
+        """
+        Switch between weighted and generalised least-squares
+
+        @param mode:    'wls' or 'gls'
+        """
+        if mode not in ['wls', 'gls']:
+            raise ValueError("Fit mode {0} not supported".format(mode))
+        if mode != self.mode:
+            self.mode = mode
+            self._noise = None
+            self._cho = None
+
+    def cinv(self, X):
+        """
+        Apply the inverse of the TOA covariance matrix to X
+
+        @param X:   (ntoas,) or (ntoas, k) array
+        """
+        if self.mode == 'gls':
+            if self._noise is None:
+                # The noise model only changes on a reset; deletions only
+                # redo the factorisation
+                if self._noisebase is None:
+                    self._noisebase = noise_covariance(self.model, self.toas)
+                self._noise = self._noisebase.with_deleted(self.deleted)
+            return self._noise.solve(X)
+        w = self.weights if np.ndim(X) == 1 else self.weights[:,None]
+        return w * X
+
+    def _normal_equations(self, M, r):
+        """
+        Return the column-normalised normal equations A, b, and the column
+        norms, of the least-squares problem M x = r
+        """
+        CinvM = self.cinv(M)
+        A = np.dot(M.T, CinvM)
+        norm = np.sqrt(np.diag(A))
+        norm[norm == 0] = 1.0
+        A = A / np.outer(norm, norm)
+        b = np.dot(CinvM.T, r) / norm
+        return A, b, norm
+
+    def set_fit_state(self, par, state):
+        """
+        Change whether a parameter is fitted for
+
+        @param par:     Name of the parameter
+        @param state:   True if the parameter should be fitted
+        """
+        getattr(self.model_init, par).frozen = not state
+        self.sync_model_init()
+
+    def sync_model_init(self):
+        """
+        Pick up edits of the pre-fit model. When values were edited, start
+        again from the pre-fit model. When only fit flags were, copy them:
+        the columns of parameters that are still fitted remain valid
+
+        @return:    True if the model was reset
+        """
+        values, frozen = model_fingerprint(self.model_init)
+        if values != self.init_fingerprint[0]:
+            self.reset_model()
+            return True
+        if frozen != self.init_fingerprint[1]:
+            for p in self.model_init.params:
+                getattr(self.model, p).frozen = getattr(self.model_init, p).frozen
+            self.init_fingerprint = (values, frozen)
+            self._params = None
+            self._cho = None
+        return False
+
+    def set_deleted(self, deleted, maxupdates=None):
+        """
+        Change which TOAs are excluded from the fit. When only a few TOAs
+        change, the factorisation of the normal equations is updated rather
+        than recomputed
+
+        @param deleted:     Boolean array, True for TOAs to exclude
+        @param maxupdates:  Maximum number of rank-1 updates before a full
+                            refactorisation is cheaper (default: number of
+                            columns of the design matrix)
+        """
+        deleted = np.array(deleted, dtype=bool)
+        if deleted.shape != self.deleted.shape:
+            raise ValueError("Deletion mask has {0} elements, need {1}".format( \
+                    len(deleted), len(self.deleted)))
+
+        changed = np.flatnonzero(deleted != self.deleted)
+        self.deleted = deleted
+        self.weights = np.where(deleted, 0.0, 1.0 / self.sigma**2)
+        if len(changed) > 0:
+            self._noise = None
+        if self.mode == 'gls':
+            # Correlated noise couples TOAs: no rank-1 updates
+            self._cho = None
+        if len(changed) == 0 or self._cho is None:
+            return
+
+        if maxupdates is None:
+            maxupdates = len(self._params)
+        R = self._cho[0] if len(changed) <= maxupdates else None
+        for ind in changed:
+            if R is None:
+                break
+            # Row of the normalised, weighted design matrix for this TOA
+            row = self._M[ind] / (self.sigma[ind] * self._norm)
+            R = cholesky.cholupdate(R, row, -1.0 if deleted[ind] else 1.0)
+
+        if R is None:
+            self._cho = None
+        else:
+            self._cho = (R, None)
+            self._A = np.dot(R.T, R)
+
+    def linearise(self):
+        """
+        Compute the design matrix of the fitted parameters at the current
+        post-fit model. Columns the cache already has for this model are not
+        recomputed
+        """
+        M, params, units = self.dmcache.designmatrix(self.model, self.fitparams)
+        self._columns = dict((p, np.array(M[:,ii])) for ii, p in enumerate(params))
+        self._units = dict(zip(params, units))
+        self._params = None
+        self._cho = None
+        self._fresh = True
+
+    def factorise(self):
+        """
+        Assemble and factorise the normal equations from the cached columns.
+        Parameters without a cached column trigger a new linearisation
+        """
+        params = ['Offset'] + self.fitparams
+        if any(p not in self._columns for p in params):
+            self.linearise()
+
+        M = np.column_stack([self._columns[p] for p in params])
+        r = self.residuals()
+        A, b, norm = self._normal_equations(M, r)
+
+        self._params = params
+        self._M = M
+        self._norm = norm
+        self._A = A
+        self._cho = cholesky.factorise(self._A)
+
+        degenerate = cholesky.degenerate_columns(self._cho)
+        if np.any(degenerate):
+            print("WARNING: degenerate fit parameters, not fitted: {0}".format( \
+                    ", ".join(np.array(params)[degenerate])))
+
+    def preview(self):
+        """
+        Predict the post-fit residuals for the current fit set, without a PINT
+        residual evaluation: the residuals minus their weighted projection on
+        the design matrix columns at the current model (one linear step)
+
+        @return:    The predicted residuals (s)
+        """
+        M, params, units = self.dmcache.designmatrix(self.model, self.fitparams)
+        r = self.residuals()
+        A, b, norm = self._normal_equations(M, r)
+        dx = np.linalg.lstsq(A, b, rcond=None)[0] / norm
+        return r - np.dot(M, dx)
+
+    def fit_toas(self, maxiter=1, threshold=1e-3):
+        """
+        Fit the model to the TOAs. Iterates until maxiter iterations were done,
+        or until no parameter changes by more than threshold times its
+        uncertainty
+
+        @param maxiter:     Maximum number of iterations
+        @param threshold:   Convergence criterion, in parameter uncertainties
+
+        @return:    The post-fit chi^2
+        """
+        chi2 = self.chi2
+        self.niter = 0
+        self.converged = False
+
+        while self.niter < maxiter:
+            if self._cho is None or self._params[1:] != self.fitparams:
+                self.factorise()
+            fresh = self._fresh
+
+            # Normal equations: A dx = M^T C^-1 r, in normalised units
+            r = self.residuals()
+            b = np.dot(self._M.T, self.cinv(r)) / self._norm
+            dx, Ainv = cholesky.solve(self._cho, b)
+            errs = np.sqrt(np.diag(Ainv)) / self._norm
+            dx /= self._norm
+
+            oldmodel = copy.deepcopy(self.model)
+            for ii, p in enumerate(self._params):
+                if p == 'Offset':
+                    continue
+                par = getattr(self.model, p)
+                punit = u.s / self._units[p]
+                par.quantity = par.quantity + dx[ii] * punit
+                _set_uncertainty(par, errs[ii] * punit)
+            self._fresh = False
+
+            self.resids = pint.residuals.resids(self.toas, self.model)
+            newchi2 = self.chi2
+
+            if newchi2 > chi2 * (1 + 1e-9) and not fresh:
+                # The cached design matrix is too far from the current model.
+                # Undo the step, and relinearise at the current model
+                self.model = oldmodel
+                self.resids = pint.residuals.resids(self.toas, self.model)
+                self.linearise()
+                continue
+
+            self.niter += 1
+            chi2 = newchi2
+            self.covariance = Ainv / np.outer(self._norm, self._norm)
+            if np.all(np.abs(dx) <= threshold * errs):
+                self.converged = True
+                break
+
+        return chi2
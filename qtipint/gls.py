@@ -0,0 +1,208 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+gls: Noise covariance of TOAs in low-rank-plus-diagonal form
+
+The covariance of the TOAs is C = N + U J U^T + F Phi F^T, with N the diagonal
+white noise (EFAC/EQUAD scaled TOA uncertainties), U J U^T the ECORR noise
+(block diagonal: one block per observing epoch), and F Phi F^T the red noise
+with a low-rank basis F. C is never formed: solves use Sherman-Morrison per
+ECORR block, and the Woodbury identity for the red noise, so the cost is
+linear in the number of TOAs.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+import copy
+
+# Numpy etc.
+import numpy as np
+import scipy.linalg as sl
+import astropy.units as u
+
+
+class NoiseCovariance(object):
+    """
+    Covariance matrix C = N + U J U^T + F Phi F^T of a set of TOAs, which can
+    solve C x = b. Deleted TOAs have infinite white noise, so they drop out.
+    The ECORR epochs are sorted once; with_deleted only redoes the parts that
+    depend on the deleted TOAs
+    """
+
+    def __init__(self, sigma, epochs=None, ecorr=None, F=None, phi=None, \
+            deleted=None):
+        """
+        @param sigma:   White noise (scaled TOA uncertainties) of each TOA (s)
+        @param epochs:  ECORR epoch index of each TOA, -1 for TOAs without
+                        ECORR, or None
+        @param ecorr:   ECORR variance of each epoch (s^2)
+        @param F:       (ntoas, nbasis) red noise basis, or None
+        @param phi:     Prior variance of the red noise basis functions (s^2)
+        @param deleted: Boolean array of deleted TOAs, or None
+        """
+        self.sigma = np.asarray(sigma, dtype=np.float64)
+        self.ntoas = len(self.sigma)
+
+        # ECORR blocks: TOAs sorted by epoch, and the start of every epoch
+        self._order = None
+        if epochs is not None and ecorr is not None:
+            epochs = np.asarray(epochs)
+            order = np.argsort(epochs, kind='mergesort')
+            order = order[epochs[order] >= 0]
+            if len(order) > 0:
+                eo = epochs[order]
+                self._order = order
+                self._starts = np.flatnonzero(np.r_[True, eo[1:] != eo[:-1]])
+                self._counts = np.diff(np.r_[self._starts, len(order)])
+                self._j = np.asarray(ecorr, dtype=np.float64)[eo[self._starts]]
+
+        self.F, self.phi = None, None
+        if F is not None and phi is not None and len(phi) > 0:
+            self.F = np.asarray(F, dtype=np.float64)
+            self.phi = np.asarray(phi, dtype=np.float64)
+
+        self._factorise(deleted)
+
+    def _factorise(self, deleted):
+        """
+        Compute the parts of the solve that depend on the deleted TOAs
+        """
+        self.invn = 1.0 / self.sigma**2
+        if deleted is not None:
+            self.invn[np.asarray(deleted, dtype=bool)] = 0.0
+
+        if self._order is not None:
+            d = np.add.reduceat(self.invn[self._order], self._starts)
+            self._coef = self._j / (1.0 + self._j * d)
+
+        # Red noise: Woodbury with the white + ECORR part as the base
+        if self.F is not None:
+            self._DinvF = self._solve_block(self.F)
+            S = np.diag(1.0 / self.phi) + np.dot(self.F.T, self._DinvF)
+            self._Scho = sl.cho_factor(S)
+
+    def with_deleted(self, deleted):
+        """
+        Return the covariance of the same noise, with other TOAs deleted. The
+        ECORR epochs and the red noise basis are shared
+
+        @param deleted: Boolean array of deleted TOAs, or None
+        """
+        cov = copy.copy(self)
+        cov._factorise(deleted)
+        return cov
+
+    def _solve_block(self, X):
+        """
+        Solve (N + U J U^T) Y = X with Sherman-Morrison per ECORR block
+        """
+        X = np.asarray(X, dtype=np.float64)
+        invn = self.invn if X.ndim == 1 else self.invn[:,None]
+        Y = invn * X
+        if self._order is not None:
+            Yo = Y[self._order]
+            s = np.add.reduceat(Yo, self._starts, axis=0)
+            coef = self._coef if X.ndim == 1 else self._coef[:,None]
+            corr = np.repeat(coef * s, self._counts, axis=0)
+            Y[self._order] = Yo - invn[self._order] * corr
+        return Y
+
+    def solve(self, X):
+        """
+        Return C^{-1} X
+
+        @param X:   (ntoas,) or (ntoas, k) array
+        """
+        Y = self._solve_block(X)
+        if self.F is not None:
+            Y = Y - np.dot(self._DinvF, sl.cho_solve(self._Scho, \
+                    np.dot(self._DinvF.T, X)))
+        return Y
+
+def quantise(t, dt=1.0, nmin=2):
+    """
+    Group times into ECORR epochs, like the quantization matrix of PINT: the
+    sorted times are split where the gap to the previous one is at least dt,
+    and epochs with fewer than nmin TOAs are dropped
+
+    @param t:       Times (s)
+    @param dt:      Smallest gap between epochs (s)
+    @param nmin:    Smallest number of TOAs in an epoch
+
+    @return:    Epoch index of every time (-1 if dropped), number of epochs
+    """
+    t = np.asarray(t, dtype=np.float64)
+    if len(t) == 0:
+        return np.zeros(0, dtype=np.int64), 0
+    order = np.argsort(t, kind='mergesort')
+    group = np.cumsum(np.r_[True, np.diff(t[order]) >= dt]) - 1
+
+    keep = np.bincount(group) >= nmin
+    renumber = np.where(keep, np.cumsum(keep) - 1, -1)
+    epochs = np.empty(len(t), dtype=np.int64)
+    epochs[order] = renumber[group]
+    return epochs, int(np.count_nonzero(keep))
+
+def _ecorr_epochs(comp, toas):
+    """
+    Return the ECORR epoch of every TOA (-1 for none) and the ECORR variance
+    of every epoch (s^2), from the TOA selections of the ECORR parameters.
+    Falls back on the dense quantization matrix of the component
+
+    @param comp:    The ECORR noise component
+    @param toas:    The PINT TOAs object
+    """
+    if hasattr(comp, 'get_ecorrs'):
+        t = np.asarray(toas.table['tdbld'], dtype=np.float64) * 86400.0
+        epochs = np.full(len(t), -1, dtype=np.int64)
+        ecorr = []
+        for par in comp.get_ecorrs():
+            idx = np.asarray(par.select_toa_mask(toas))
+            if idx.dtype == bool:
+                idx = np.flatnonzero(idx)
+            if len(idx) == 0:
+                continue
+            ep, nepochs = quantise(t[idx])
+            sel = ep >= 0
+            epochs[idx[sel]] = ep[sel] + len(ecorr)
+            ecorr += [par.quantity.to(u.s).value**2] * nepochs
+        return epochs, np.array(ecorr, dtype=np.float64)
+
+    U, weights = comp.ecorr_basis_weight_pair(toas)
+    U = np.asarray(U)
+    if U.shape[1] == 0:
+        return None, None
+    return np.where(U.any(axis=1), np.argmax(U, axis=1), -1), \
+            np.asarray(weights, dtype=np.float64)
+
+def noise_covariance(model, toas, deleted=None):
+    """
+    Build the NoiseCovariance of the noise components of a PINT timing model
+
+    @param model:   The timing model (with EFAC/EQUAD/ECORR/red noise)
+    @param toas:    The PINT TOAs object
+    @param deleted: Boolean array of deleted TOAs, or None
+    """
+    if hasattr(model, 'scaled_sigma'):
+        sigma = model.scaled_sigma(toas).to(u.s).value
+    else:
+        print("WARNING: model cannot scale TOA uncertainties; using raw errors")
+        sigma = toas.get_errors().to(u.s).value
+
+    epochs, ecorr, Fs, phis = None, None, [], []
+    for comp in model.components.values():
+        if hasattr(comp, 'ecorr_basis_weight_pair'):
+            cepochs, cecorr = _ecorr_epochs(comp, toas)
+            if cecorr is not None and len(cecorr) > 0:
+                epochs, ecorr = cepochs, cecorr
+        if hasattr(comp, 'pl_rn_basis_weight_pair'):
+            F, phi = comp.pl_rn_basis_weight_pair(toas)
+            Fs.append(np.asarray(F))
+            phis.append(np.asarray(phi, dtype=np.float64))
+
+    F = np.hstack(Fs) if len(Fs) > 0 else None
+    phi = np.concatenate(phis) if len(phis) > 0 else None
+    return NoiseCovariance(sigma, epochs=epochs, ecorr=ecorr, F=F, phi=phi, \
+            deleted=deleted)
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+loader: Load pulsars in a worker thread, so the Qt event loop keeps running
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+import traceback
+
+from qtconsole.qt import QtCore
+
+import qtipint.pulsar as pu
+
+
+class LoadCancelled(Exception):
+    """
+    Raised from the progress callback of a load that has been cancelled
+    """
+    pass
+
+class PulsarLoader(QtCore.QThread):
+    """
+    Worker thread that creates a Pulsar object. Progress, the result, and
+    failures are reported through signals, which Qt delivers in the thread of
+    the receiver.
+
+    Cancelling is cooperative: the load is aborted at the next stage boundary
+    """
+    progress = QtCore.Signal(str, int)
+    loaded = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+
+    def __init__(self, parfilename=None, timfilename=None, testpulsar=False, \
+            parent=None):
+        super(PulsarLoader, self).__init__(parent)
+
+        self.parfilename = parfilename
+        self.timfilename = timfilename
+        self.testpulsar = testpulsar
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Request the load to stop. No further signals are emitted
+        """
+        self.cancelled = True
+
+    def reportStage(self, stage):
+        """
+        Progress callback, called by Pulsar at the start of each load stage
+        """
+        if self.cancelled:
+            raise LoadCancelled()
+
+        percent = int(100 * pu.load_stages.index(stage) / len(pu.load_stages))
+        self.progress.emit(pu.load_stage_descriptions[stage], percent)
+
+    def run(self):
+        try:
+            psr = pu.Pulsar(self.parfilename, self.timfilename, \
+                    testpulsar=self.testpulsar, progress=self.reportStage)
+        except LoadCancelled:
+            print("Loading of pulsar %s cancelled" % str(self.parfilename))
+            return
+        except Exception as err:
+            traceback.print_exc()
+            if not self.cancelled:
+                self.failed.emit(str(err))
+            return
+
+        if not self.cancelled:
+            self.loaded.emit(psr)
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+overlay: Blitted overlay artists on top of a static matplotlib plot
+
+Redrawing the whole figure for a moving rubber band or a hover marker costs
+as much as drawing all the TOAs. Instead, the overlay artists are 'animated':
+a normal draw of the figure leaves them out, and the overlay saves the
+rendered axes as a background. To update the overlay, the background is
+restored, only the overlay artists are drawn on top, and only the axes area
+is copied to the screen.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+
+class BlitOverlay(object):
+    """
+    Set of animated artists in one Axes, drawn by blitting over the saved
+    background of the Axes. The background is saved on every full draw of the
+    canvas (draw_event), so it follows changes of the plot and resizes
+    """
+
+    def __init__(self, canvas, axes):
+        """
+        @param canvas:  The matplotlib FigureCanvas (Agg based)
+        @param axes:    The Axes that the overlay artists are in
+        """
+        self.canvas = canvas
+        self.axes = axes
+        self.artists = []
+        self.background = None
+        self.cid = canvas.mpl_connect('draw_event', self.onDraw)
+
+    def add(self, artist):
+        """
+        Make an artist part of the overlay
+
+        @return:    The artist
+        """
+        artist.set_animated(True)
+        self.artists.append(artist)
+        return artist
+
+    def reset(self, axes=None):
+        """
+        Forget all artists and the background. Call after clearing the axes
+
+        @param axes:    The new Axes of the overlay, if it changed
+        """
+        if axes is not None:
+            self.axes = axes
+        self.artists = []
+        self.background = None
+
+    def onDraw(self, event):
+        """
+        The canvas was drawn in full: save the background, and draw the
+        overlay artists on top of it (a full draw leaves them out)
+        """
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self.drawArtists()
+
+    def drawArtists(self):
+        for artist in self.artists:
+            if artist.get_visible() and artist.axes is self.axes:
+                self.axes.draw_artist(artist)
+
+    def update(self):
+        """
+        Show the current state of the overlay artists. Without a saved
+        background, a full redraw is requested instead
+        """
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.drawArtists()
+        self.canvas.blit(self.axes.bbox)
@@ -229,7 +229,10 @@ class ParWidget(QtGui.QWidget):
         self.setLayout(self.layout)
 
     def setPulsar(self, psr):
+        if self.psr is not None:
+            self.psr.unsubscribe(self.pulsarChanged)
         self.psr = psr
+        self.psr.subscribe(self.pulsarChanged, ['model', 'fitset', 'fit'])
 
         self.choiceWidget.setCallbacks(self.set_model)
         self.editWidget.setCallbacks(self.psr._model)
@@ -244,6 +247,15 @@ class ParWidget(QtGui.QWidget):
         elif choice == 'prefit':
             self.editWidget.setCallbacks(self.psr._model)
 
+    def pulsarChanged(self, psr, aspects):
+        '''
+        Reload the table when the model that it shows has changed
+        '''
+        choice = self.choiceWidget.getChoice()
+        if 'fitset' in aspects or (choice == 'prefit' and 'model' in aspects) \
+                or (choice == 'postfit' and 'fit' in aspects):
+            self.set_model()
+
     def updateModel(self, model, table):
         for xx in range(table.rowCount()):
             par = table.item(xx, 0).text()
@@ -275,6 +287,8 @@ class ParWidget(QtGui.QWidget):
 
     def applyChanges(self):
         self.updateModel(self.psr._model, self.editWidget.table)
+        # Let the pulsar (and through it, the plot) know what changed
+        self.psr.check_for_changes()
 
     def writePar(self):
         model = copy.deepcopy(self.psr._model)
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+pickindex: Spatial index over plotted points, for picking and selection
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Numpy etc.
+import numpy as np
+from scipy.spatial import cKDTree
+from matplotlib.path import Path
+
+
+def clamp_span(span):
+    """
+    Return the span of an axis as a positive, finite number: a degenerate
+    (zero or non-finite) span becomes 1
+    """
+    span = abs(float(span))
+    if not np.isfinite(span) or span == 0:
+        return 1.0
+    return span
+
+class PointIndex(object):
+    """
+    Index over a set of plotted points. Distances are measured in coordinates
+    normalised by the axis spans, so that 'nearest' matches what the user sees.
+    Nearest-point queries go through a KD-tree, range queries along a single
+    axis and rectangle queries through the points sorted on x and on y
+    """
+
+    def __init__(self, x, y, xspan, yspan):
+        """
+        @param x:       x-coordinates of the points
+        @param y:       y-coordinates of the points
+        @param xspan:   Width of the visible x-range
+        @param yspan:   Height of the visible y-range
+        """
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.xspan = clamp_span(xspan)
+        self.yspan = clamp_span(yspan)
+
+        # The KD-tree only takes finite coordinates
+        self.finite = np.flatnonzero(np.isfinite(self.x) & np.isfinite(self.y))
+        self.tree = cKDTree(np.column_stack([self.x[self.finite] / self.xspan, \
+                self.y[self.finite] / self.yspan]))
+
+        self.xorder = np.argsort(self.x, kind='mergesort')
+        self.xsorted = self.x[self.xorder]
+        self.yorder = np.argsort(self.y, kind='mergesort')
+        self.ysorted = self.y[self.yorder]
+
+    def _nearest_sorted(self, sortedvals, order, c):
+        """
+        Position of the point closest to c, along one axis
+        """
+        i = np.searchsorted(sortedvals, c)
+        cand = [j for j in (i-1, i) if 0 <= j < len(sortedvals)]
+        best = min(cand, key=lambda j: abs(sortedvals[j] - c))
+        return order[best], abs(sortedvals[best] - c)
+
+    def nearest(self, cx, cy, which='xy', maxdist=None):
+        """
+        Find the point nearest to the given coordinates
+
+        @param cx:      x-value of the coordinates
+        @param cy:      y-value of the coordinates
+        @param which:   which axis to include in distance measure [xy/x/y]
+        @param maxdist: If set, maximum normalised distance to a point
+
+        @return:    Position of the nearest point, or None
+        """
+        if len(self.x) == 0:
+            return None
+
+        if which == 'xy':
+            if len(self.finite) == 0:
+                return None
+            dist, pos = self.tree.query([cx / self.xspan, cy / self.yspan])
+            pos = self.finite[pos]
+        elif which == 'x':
+            pos, dist = self._nearest_sorted(self.xsorted, self.xorder, cx)
+            dist /= self.xspan
+        elif which == 'y':
+            pos, dist = self._nearest_sorted(self.ysorted, self.yorder, cy)
+            dist /= self.yspan
+        else:
+            raise ValueError("Value {0} not a valid option for nearest".format(which))
+
+        if maxdist is not None and dist > maxdist:
+            return None
+        return int(pos)
+
+    def in_rect(self, x0, x1, y0, y1):
+        """
+        Find the points within a rectangle
+
+        @return:    Sorted positions of the points in the rectangle
+        """
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        i0 = np.searchsorted(self.xsorted, x0, side='left')
+        i1 = np.searchsorted(self.xsorted, x1, side='right')
+        cand = self.xorder[i0:i1]
+        return np.sort(cand[(self.y[cand] >= y0) & (self.y[cand] <= y1)])
+
+    def in_lasso(self, vertices):
+        """
+        Find the points within a polygon
+
+        @param vertices:    (n, 2) array of the vertices of the polygon
+
+        @return:    Sorted positions of the points in the polygon
+        """
+        vertices = np.asarray(vertices, dtype=np.float64)
+        if len(vertices) < 3:
+            return np.zeros(0, dtype=int)
+        cand = self.in_rect(vertices[:,0].min(), vertices[:,0].max(), \
+                vertices[:,1].min(), vertices[:,1].max())
+        inside = Path(vertices).contains_points( \
+                np.column_stack([self.x[cand], self.y[cand]]))
+        return cand[inside]
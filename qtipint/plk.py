@@ -146,6 +146,7 @@ import matplotlib
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt4agg import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
+import matplotlib.transforms as mtransforms
 
 # Numpy etc.
 import numpy as np
@@ -154,6 +155,11 @@ import copy
 
 import constants
 import pulsar as pu
+from plkrender import ErrorbarRenderer
+from decimate import DecimationPyramid
+from pickindex import PointIndex, clamp_span
+from overlay import BlitOverlay
+from scanthread import ScanThread
 
 
 # Design philosophy:
@@ -187,6 +193,10 @@ class PlkActionsWidget(QtGui.QWidget):
         self.writePar_callback=None
         self.writeTim_callback=None
         self.saveFig_callback=None
+        self.preview_callback=None
+        self.fitMode_callback=None
+        self.ftest_callback=None
+        self.gridScan_callback=None
 
         self.hbox = QtGui.QHBoxLayout()     # One horizontal layout
 
@@ -213,11 +223,33 @@ class PlkActionsWidget(QtGui.QWidget):
         button.clicked.connect(self.saveFig)
         self.hbox.addWidget(button)
 
+        self.ftestButton = QtGui.QPushButton('F-test')
+        self.ftestButton.clicked.connect(self.ftest)
+        self.hbox.addWidget(self.ftestButton)
+
+        self.gridScanButton = QtGui.QPushButton('Chi2 scan')
+        self.gridScanButton.clicked.connect(self.gridScan)
+        self.hbox.addWidget(self.gridScanButton)
+
+        self.fitModeBox = QtGui.QComboBox(self)
+        self.fitModeBox.addItems(['WLS', 'GLS'])
+        self.fitModeBox.currentIndexChanged.connect(self.fitMode)
+        self.hbox.addWidget(self.fitModeBox)
+
+        self.previewCheckBox = QtGui.QCheckBox('Preview', self)
+        self.previewCheckBox.stateChanged.connect(self.preview)
+        self.hbox.addWidget(self.previewCheckBox)
+
         self.hbox.addStretch(1)
 
+        # Progress of a scan that runs in the background
+        self.scanLabel = QtGui.QLabel('', self)
+        self.hbox.addWidget(self.scanLabel)
+
         self.setLayout(self.hbox)
 
-    def setCallbacks(self, updatePlot, reFit, writePar, writeTim, saveFig):
+    def setCallbacks(self, updatePlot, reFit, writePar, writeTim, saveFig, \
+            preview=None, fitMode=None, ftest=None, gridScan=None):
         """
         Callback functions
         """
@@ -226,6 +258,10 @@ class PlkActionsWidget(QtGui.QWidget):
         self.writePar_callback = writePar
         self.writeTim_callback = writeTim
         self.saveFig_callback = saveFig
+        self.preview_callback = preview
+        self.fitMode_callback = fitMode
+        self.ftest_callback = ftest
+        self.gridScan_callback = gridScan
         
 
     def reFit(self):
@@ -245,11 +281,38 @@ class PlkActionsWidget(QtGui.QWidget):
     def clearAll(self):
         print("Clear clicked")
 
+    def preview(self):
+        if self.preview_callback is not None:
+            self.preview_callback(self.previewCheckBox.isChecked())
+
+    def fitMode(self):
+        if self.fitMode_callback is not None:
+            self.fitMode_callback(str(self.fitModeBox.currentText()).lower())
+
+    def ftest(self):
+        if self.ftest_callback is not None:
+            self.ftest_callback()
+
+    def gridScan(self):
+        if self.gridScan_callback is not None:
+            self.gridScan_callback()
+
     def saveFig(self):
         if self.saveFig_callback is not None:
             self.saveFig_callback()
         print("Save fig clicked")
 
+    def setScanStatus(self, message):
+        """
+        Show the progress of a background scan. While a scan runs, no other
+        scan can be started
+
+        @param message: Progress message, or None when no scan is running
+        """
+        self.ftestButton.setEnabled(message is None)
+        self.gridScanButton.setEnabled(message is None)
+        self.scanLabel.setText('' if message is None else message)
+
 
 class PlkFitboxesWidget(QtGui.QWidget):
     """
@@ -518,6 +581,40 @@ class PlkXYPlotWidget(QtGui.QWidget):
 
 
 
+class PlkFTestDialog(QtGui.QDialog):
+    """
+    A dialog that shows the results of an F-test scan in a sortable table
+    """
+
+    columns = ['Parameter', 'Delta chi2', 'F', 'p-value']
+
+    def __init__(self, results, parent=None, **kwargs):
+        """
+        @param results: List of (parameter, delta chi2, F, p-value)
+        """
+        super(PlkFTestDialog, self).__init__(parent, **kwargs)
+        self.setWindowTitle('F-test scan')
+        self.setMinimumSize(450, 300)
+
+        self.table = QtGui.QTableWidget(len(results), len(self.columns), self)
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+
+        for ii, row in enumerate(results):
+            self.table.setItem(ii, 0, QtGui.QTableWidgetItem(row[0]))
+            for jj, val in enumerate(row[1:]):
+                # Store the number itself, so that sorting is numerical
+                item = QtGui.QTableWidgetItem()
+                item.setData(QtCore.Qt.DisplayRole, float(val))
+                self.table.setItem(ii, jj+1, item)
+        self.table.setSortingEnabled(True)
+        self.table.resizeColumnsToContents()
+
+        vbox = QtGui.QVBoxLayout()
+        vbox.addWidget(self.table)
+        self.setLayout(vbox)
+
+
 class PlkWidget(QtGui.QWidget):
     """
     The plk-emulator window.
@@ -535,6 +632,9 @@ class PlkWidget(QtGui.QWidget):
         self.psr = None
         self.parent = parent
 
+        # F-test or chi^2 scan running in a worker thread
+        self.scanThread = None
+
     def initPlk(self):
         self.setMinimumSize(650, 550)
 
@@ -564,10 +664,58 @@ class PlkWidget(QtGui.QWidget):
         # Done creating the Figure. Restore color scheme to defaults
         self.setColorScheme(False)
         
+        # Highlighting, the selection rubber band, the START/FINISH markers
+        # and the hover marker are blitted over the static plot
+        self.plkOverlay = BlitOverlay(self.plkCanvas, self.plkAxes)
+
+        # The artists of the residual plot. They are created on the first
+        # plot, and updated in-place afterwards
+        self.resetPlotArtists()
+
+        # Level-of-detail: when there are more than lodFactor points per
+        # pixel column, only a decimated subset of the points is drawn
+        self.lodEnabled = True
+        self.lodFactor = 4
+
+        # Indices of the TOAs that are highlighted. These are always drawn
+        self.highlighted = np.zeros(0, dtype=int)
+
+        # TOA under the mouse cursor, and the x of the START/FINISH markers
+        # of the zoom range (None when not set)
+        self.hoverIndex = None
+        self.zoomMarkers = [None, None]
+
+        # Preview mode: instead of the post-fit residuals, show the linearised
+        # prediction of the post-fit residuals for the checked fit parameters
+        self.previewEnabled = False
+
+        # Binning ('b' key): width of the time bins in days, or None
+        self.binSize = None
+
+        # Redraw requests are coalesced: the first one starts a timer, and
+        # everything requested before it fires results in a single redraw.
+        # The redraw is skipped when nothing that is plotted has changed
+        self.redrawInterval = 20        # Milliseconds
+        self.redrawForced = False
+        self.redrawTimer = QtCore.QTimer(self)
+        self.redrawTimer.setSingleShot(True)
+        self.redrawTimer.setInterval(self.redrawInterval)
+        self.redrawTimer.timeout.connect(self.redrawNow)
+
+        # Observations: join the points of one observation by lines ('j'),
+        # and mark where every observation starts ('I')
+        self.joinPoints = False
+        self.indicateEpochs = False
+
         # Call-back functions for clicking and key-press.
         self.plkCanvas.mpl_connect('button_press_event', self.canvasClickEvent)
+        self.plkCanvas.mpl_connect('button_release_event', self.canvasReleaseEvent)
+        self.plkCanvas.mpl_connect('motion_notify_event', self.canvasMotionEvent)
         self.plkCanvas.mpl_connect('key_press_event', self.canvasKeyEvent)
 
+        # Mouse selection in progress: list of (x, y) data coordinates
+        self.plkSelection = None
+
         # Create the navigation toolbar, tied to the canvas
         #
         #self.mpl_toolbar = NavigationToolbar(self.canvas, self.main_frame)
@@ -624,29 +772,88 @@ class PlkWidget(QtGui.QWidget):
         """
         self.setColorScheme(True)
         self.plkAxes.clear()
+        self.resetPlotArtists()
+
+        # Re-decimate when the visible x-range changes. Clearing the axes
+        # also clears their callbacks, so connect here
+        self.plkAxes.callbacks.connect('xlim_changed', self.plotLimitsChanged)
+
         self.plkAxes.grid(True)
         self.plkAxes.set_xlabel('MJD')
         self.plkAxes.set_ylabel('Residual ($\mu$s)')
         self.plkCanvas.draw()
         self.setColorScheme(False)
 
+    def resetPlotArtists(self):
+        """
+        Forget about the artists of the residual plot, so that they are
+        created anew on the next plot. Call after clearing the axes
+        """
+        self.plkRenderer = None         # ErrorbarRenderer of the residuals
+        self.plkPyramid = None          # DecimationPyramid of the plot data
+        self.plkPyramidKey = None       # (x, y, yerr, mask) of the pyramid
+        self.plkUpdating = False        # True while plotResiduals sets limits
+        self.plotData = None            # (x, y, yerr) of the plotted points
+        self.plotIndex = None           # TOA index of each plotted point
+        self.plotBins = None            # TOABins of the points, if binned
+        self.plkIndex = None            # PointIndex of the plot data
+        self.plkIndexAspect = None      # log(xspan/yspan) of plkIndex
+        self.plkJumpArtists = []        # Phase jump lines and annotations
+        self.plkJoinLine = None         # Lines within every observation
+        self.plkEpochLines = None       # Start of every observation
+        self.plkLabels = None           # (xlabel, ylabel) currently shown
+        self.plkTitle = None
+        self.lastDrawState = None       # plotState() of the last draw
+        self.plkScanShown = False       # A chi^2 scan replaced the residuals
+
+        # Overlay artists. These are never part of a full draw
+        self.plkOverlay.reset()
+        self.plkHighlight = self.plkOverlay.add(self.plkAxes.plot([], [], \
+                linestyle='none', marker='o', markerfacecolor='none', \
+                color='red')[0])
+        self.plkHover = self.plkOverlay.add(self.plkAxes.plot([], [], \
+                linestyle='none', marker='o', markersize=10, \
+                markerfacecolor='none', color='green')[0])
+        self.plkRubberBand = self.plkOverlay.add(self.plkAxes.plot([], [], \
+                color='black', linestyle='--', linewidth=0.8)[0])
+        # x in data coordinates, y spans the axes
+        trans = mtransforms.blended_transform_factory(self.plkAxes.transData, \
+                self.plkAxes.transAxes)
+        self.plkZoomMarkers = self.plkOverlay.add(self.plkAxes.plot([], [], \
+                color='darkgreen', linewidth=1.0, transform=trans, \
+                scalex=False, scaley=False)[0])
+
     def setPulsar(self, psr):
         """
         We've got a new pulsar!
         """
+        if self.psr is not None:
+            self.psr.unsubscribe(self.pulsarChanged)
         self.psr = psr
+        self.psr.subscribe(self.pulsarChanged)
 
         # Update the fitting checkboxes
         self.fitboxesWidget.setCallbacks(self.fitboxChecked, psr.compsSetParamsDict,
                 psr.fitparams, pu.nofitboxpars)
-        self.xyChoiceWidget.setCallbacks(self.updatePlot)
-        self.actionsWidget.setCallbacks(self.updatePlot, self.reFit, self.writePar, self.writeTim, self.saveFig)
+        self.lastDrawState = None
+        self.xyChoiceWidget.setCallbacks(self.scheduleRedraw)
+        self.actionsWidget.setCallbacks(self.scheduleRedraw, self.reFit, self.writePar, self.writeTim, self.saveFig, self.setPreview, self.setFitMode, self.runFTest, self.runGridScan)
+        self.actionsWidget.fitMode()
 
         # Draw the residuals
         self.xyChoiceWidget.updateChoice()
         # This screws up the show/hide logistics
         #self.show()
 
+    def pulsarChanged(self, psr, aspects):
+        """
+        Called by the pulsar when its state changed
+
+        @param psr:     The Pulsar object
+        @param aspects: List of the aspects that changed
+        """
+        self.scheduleRedraw()
+
     def fitboxChecked(self, parchanged, newstate):
         """
         When a fitbox is (un)checked, this callback function is called
@@ -655,6 +862,132 @@ class PlkWidget(QtGui.QWidget):
         @param newstate:    The new state of the checkbox
         """
         self.psr.set_fit_state(parchanged, newstate)
+        if self.previewEnabled:
+            self.scheduleRedraw()
+
+    def setPreview(self, enabled):
+        """
+        Switch the preview of the post-fit residuals on or off
+
+        @param enabled: Whether the preview is shown
+        """
+        self.previewEnabled = enabled
+        if self.psr is not None:
+            self.scheduleRedraw()
+
+    def setFitMode(self, mode):
+        """
+        Switch the fitter between weighted and generalised least-squares
+
+        @param mode:    'wls' or 'gls'
+        """
+        if self.psr is not None:
+            self.psr.set_fit_mode(mode)
+            if self.previewEnabled:
+                self.scheduleRedraw()
+
+    def runFTest(self):
+        """
+        Run an F-test scan over the parameters that are not fitted for, in
+        the background, and show the results when it has finished
+        """
+        if self.psr is not None:
+            self.startScan('F-test', self.psr.ftest_scan, self.ftestDone)
+
+    def ftestDone(self, results):
+        """
+        The F-test scan has finished: show the results
+
+        @param results: List of (parameter, delta chi2, F, p-value)
+        """
+        self.ftestDialog = PlkFTestDialog(results, parent=self)
+        self.ftestDialog.show()
+
+    def runGridScan(self):
+        """
+        Ask for one or two parameters and a range, and map the chi^2 over
+        that range in the background. The result replaces the residual plot
+        until the next redraw
+        """
+        if self.psr is None:
+            return
+        text, ok = QtGui.QInputDialog.getText(self, 'Chi2 scan', \
+                'One or two parameters, separated by commas:')
+        if not ok:
+            return
+        params = [p.strip() for p in str(text).split(',') if p.strip() != '']
+        if not 1 <= len(params) <= 2:
+            print("WARNING: a chi2 scan needs one or two parameters")
+            return
+
+        nsigma, ok = QtGui.QInputDialog.getDouble(self, 'Chi2 scan', \
+                'Range (uncertainties):', 3.0, 0.1, 100.0, 1)
+        if not ok:
+            return
+
+        # Around the post-fit value, in steps of the post-fit uncertainty
+        npoints = 41 if len(params) == 1 else 21
+        grids = []
+        for name in params:
+            if name not in self.psr.params:
+                print("WARNING: no parameter {0} in the model".format(name))
+                return
+            par = getattr(self.psr._fitter.model, name)
+            err = par.uncertainty_value
+            if err is None or not err > 0:
+                print("WARNING: {0} has no uncertainty; fit for it first".format(name))
+                return
+            grids.append(np.float64(par.value) + \
+                    np.linspace(-nsigma, nsigma, npoints) * err)
+
+        self.startScan('Chi2 scan', self.psr.grid_scan, \
+                lambda chi2: self.plotGridScan(params, grids, chi2), \
+                params=params, grids=grids)
+
+    def startScan(self, name, scan, done, **kwargs):
+        """
+        Run a scan of the pulsar in a worker thread, so the GUI stays
+        responsive. Only one scan runs at a time
+
+        @param name:    Name of the scan, for the progress message
+        @param scan:    The scan method of the pulsar
+        @param done:    Called with the result when the scan has finished
+        @param kwargs:  Arguments of the scan
+        """
+        if self.scanThread is not None:
+            print("WARNING: a scan is still running")
+            return
+        self.scanName = name
+        self.scanThread = ScanThread(scan, parent=self, **kwargs)
+        self.scanThread.progress.connect(self.scanProgress)
+        self.scanThread.done.connect(done)
+        self.scanThread.failed.connect(self.scanFailed)
+        self.scanThread.finished.connect(self.scanFinished)
+        self.actionsWidget.setScanStatus("%s running..." % name)
+        QtGui.QApplication.setOverrideCursor(QtCore.Qt.BusyCursor)
+        self.scanThread.start()
+
+    def scanProgress(self, ndone, ntotal):
+        """
+        Show the progress of the running scan
+        """
+        self.actionsWidget.setScanStatus("%s: %d of %d fits" % \
+                (self.scanName, ndone, ntotal))
+
+    def scanFailed(self, message):
+        """
+        The scan raised an exception
+        """
+        print("%s failed: %s" % (self.scanName, message))
+
+    def scanFinished(self):
+        """
+        The scan thread has finished. Release it
+        """
+        QtGui.QApplication.restoreOverrideCursor()
+        self.actionsWidget.setScanStatus(None)
+        self.scanThread.deleteLater()
+        self.scanThread = None
 
     def reFit(self):
         """
@@ -662,7 +995,7 @@ class PlkWidget(QtGui.QWidget):
         """
         if not self.psr is None:
             self.psr.fit()
-            self.updatePlot()
+            self.scheduleRedraw()
 
     def writePar(self):
         '''
@@ -724,13 +1057,70 @@ class PlkWidget(QtGui.QWidget):
         self.actionsWidget.setVisible(self.actionsVisible)
 
 
+    def plotState(self):
+        """
+        Return everything that determines the plot: the state of the pulsar,
+        the plotted quantities, and the view options
+        """
+        if self.psr is None:
+            return None
+        xid, yid = self.plotIds()
+
+        # The zoom range is in the model, and the mask selects the points
+        aspects = set(['toas', 'model', 'mask', 'phasejumps'])
+        for pid in [xid, yid]:
+            aspects.update(pu.label_dependencies.get(pid, pu.dependency_aspects))
+        versions = tuple(self.psr.version(aspect) if aspect in aspects else None \
+                for aspect in pu.dependency_aspects)
+        return versions + ((xid, yid), self.binSize, self.joinPoints, \
+                self.indicateEpochs)
+
+    def plotIds(self):
+        """
+        Return the IDs of the X and Y axis. In preview mode, the preview
+        replaces the post-fit residuals
+        """
+        xid, yid = self.xyChoiceWidget.plotids()
+        if self.previewEnabled:
+            xid = 'preview' if xid == 'post-fit' else xid
+            yid = 'preview' if yid == 'post-fit' else yid
+        return xid, yid
+
+    def scheduleRedraw(self, force=False):
+        """
+        Request a redraw of the plot. Requests are coalesced into at most one
+        redraw per redrawInterval
+
+        @param force:   Redraw even when the plot state did not change
+        """
+        self.redrawForced = self.redrawForced or force
+        if not self.redrawTimer.isActive():
+            self.redrawTimer.start()
+
+    def redrawNow(self):
+        """
+        Carry out a scheduled redraw, unless the plot state is the same as at
+        the last draw
+        """
+        if self.psr is not None:
+            self.psr.check_for_changes()
+        self.redrawTimer.stop()
+        force, self.redrawForced = self.redrawForced, False
+        if self.psr is None:
+            return
+        if force or not pu.same_state(self.plotState(), self.lastDrawState):
+            self.updatePlot()
+
     def updatePlot(self):
         """
-        Update the plot/figure
+        Update the plot/figure. The artists are kept alive between updates,
+        and only their data is replaced
         """
+        if self.plkScanShown:
+            # The artists of the scan are not ours to update: start afresh
+            self.drawSomething()
+
         self.setColorScheme(True)
-        self.plkAxes.clear()
-        self.plkAxes.grid(True)
 
         if self.psr is not None:
             # Get a mask for the plotting points
@@ -739,28 +1129,56 @@ class PlkWidget(QtGui.QWidget):
             #print("Mask has {0} toas".format(np.sum(msk)))
 
             # Get the IDs of the X and Y axis
-            xid, yid = self.xyChoiceWidget.plotids()
+            xid, yid = self.plotIds()
 
             # Retrieve the data
             x, xerr, xlabel = self.psr.data_from_label(xid)
             y, yerr, ylabel = self.psr.data_from_label(yid)
 
             if x is not None and y is not None and np.sum(msk) > 0:
-                xp = x[msk]
-                yp = y[msk]
+                if self.binSize is None:
+                    xp = x[msk]
+                    yp = y[msk]
 
-                if yerr is not None:
-                    yerrp = yerr[msk]
+                    if yerr is not None:
+                        yerrp = yerr[msk]
+                    else:
+                        yerrp = None
+                    self.plotIndex = np.flatnonzero(msk)
+                    self.plotBins = None
                 else:
-                    yerrp = None
+                    # Weighted means over the bins. A bin is represented by
+                    # its first TOA, and plotIndex must stay sorted. Picking
+                    # a bin acts on all its TOAs (see groupIndices)
+                    bins = self.psr.bin_toas(self.binSize, mask=msk)
+                    srt = np.argsort(bins.first)
+                    xp = bins.reduce(x)[srt]
+                    yp = bins.reduce(y)[srt]
+                    yerrp = bins.error[srt] if yid in ['pre-fit', 'post-fit', \
+                            'preview'] else None
+                    self.plotIndex = bins.first[srt]
+                    self.plotBins = bins
+
+                # The decimation pyramid is only rebuilt for new data
+                key = self.plkPyramidKey
+                if key is None or not (key[0] is x and key[1] is y and \
+                        key[2] is yerr and np.array_equal(key[3], msk) and \
+                        key[4] == self.binSize):
+                    self.plkPyramid = None
+                    self.plkPyramidKey = (x, y, yerr, msk, self.binSize)
 
                 self.plotResiduals(xp, yp, yerrp, xlabel, ylabel, self.psr.name)
 
                 if xid in ['mjd', 'year', 'rounded MJD']:
                     self.plotPhaseJumps(self.psr.phasejumps())
+                else:
+                    self.plotPhaseJumps([])
+                self.plotEpochs(xid, x)
             else:
                 raise ValueError("Nothing to plot!")
 
+            self.lastDrawState = self.plotState()
+
         self.plkCanvas.draw()
         self.setColorScheme(False)
 
@@ -769,6 +1187,9 @@ class PlkWidget(QtGui.QWidget):
         """
         Update the plot, given all the plotting info
         """
+        x = np.asarray(getattr(x, 'value', x), dtype=np.float64)
+        y = np.asarray(getattr(y, 'value', y), dtype=np.float64)
+
         xave = 0.5 * (np.max(x) + np.min(x))
         xmin = xave - 1.05 * (xave - np.min(x))
         xmax = xave + 1.05 * (np.max(x) - xave)
@@ -776,24 +1197,167 @@ class PlkWidget(QtGui.QWidget):
             yave = 0.5 * (np.max(y) + np.min(y))
             ymin = yave - 1.05 * (yave - np.min(y))
             ymax = yave + 1.05 * (np.max(y) - yave)
-            self.plkAxes.scatter(x, y, marker='.', color='blue')
         else:
+            yerr = np.asarray(getattr(yerr, 'value', yerr), dtype=np.float64)
             yave = 0.5 * (np.max(y+yerr) + np.min(y-yerr))
             ymin = yave - 1.05 * (yave - np.min(y-yerr))
             ymax = yave + 1.05 * (np.max(y+yerr) - yave)
-            self.plkAxes.errorbar(x.reshape([-1, 1]), y.reshape([-1, 1]), \
-                                  yerr=yerr.reshape([-1, 1]), fmt='.', color='blue')
 
-        self.plkAxes.axis([xmin.value, xmax.value, ymin.value, ymax.value])
-        self.plkAxes.get_xaxis().get_major_formatter().set_useOffset(False)
-        self.plkAxes.set_xlabel(xlabel)
-        self.plkAxes.set_ylabel(ylabel)
-        self.plkAxes.set_title(title, y=1.03)
+        self.plotData = (x, y, yerr)
+        self.plkIndex = None
+        if self.plkRenderer is None:
+            self.plkRenderer = ErrorbarRenderer(self.plkAxes, color='blue')
+
+        self.plkUpdating = True
+        self.plkAxes.axis([xmin, xmax, ymin, ymax])
+        self.plkUpdating = False
+        self.renderPlotData()
+
+        # Labels only change when the X/Y choice does
+        if self.plkLabels != (xlabel, ylabel):
+            self.plkAxes.get_xaxis().get_major_formatter().set_useOffset(False)
+            self.plkAxes.set_xlabel(xlabel)
+            self.plkAxes.set_ylabel(ylabel)
+            self.plkLabels = (xlabel, ylabel)
+        if self.plkTitle != title:
+            self.plkAxes.set_title(title, y=1.03)
+            self.plkTitle = title
+
+    def renderPlotData(self):
+        """
+        Hand the plot data to the renderer. If there are many more points than
+        pixel columns, only the points selected by the decimation pyramid for
+        the visible x-range are drawn. Highlighted points are always drawn
+        exactly. Deleted points are not part of the plot data, so they are
+        never summarised by the decimation
+        """
+        if self.plotData is None or self.plkRenderer is None:
+            return
+        x, y, yerr = self.plotData
+        hl = self.plotPositions(self.highlighted)
+
+        ncols = self.plkAxes.bbox.width
+        if self.lodEnabled and len(x) > self.lodFactor * ncols:
+            if self.plkPyramid is None:
+                self.plkPyramid = DecimationPyramid(x, y, yerr)
+            xmin, xmax = self.plkAxes.get_xlim()
+            ind = self.plkPyramid.query(xmin, xmax, ncols, always=hl)
+            self.plkRenderer.set_data(x[ind], y[ind], \
+                    None if yerr is None else yerr[ind])
+        else:
+            self.plkRenderer.set_data(x, y, yerr)
+
+        self.renderOverlay()
+
+    def groupIndices(self, indices):
+        """
+        Return the indices of all TOAs that are plotted as the same points as
+        the given TOAs: with binning, all TOAs of their bins
+
+        @param indices: TOA indices
+
+        @return:    Sorted TOA indices
+        """
+        indices = np.asarray(indices, dtype=int)
+        if self.plotBins is None:
+            return np.unique(indices)
+        groups = self.plotBins.group[indices]
+        return np.flatnonzero(np.isin(self.plotBins.group, groups[groups >= 0]))
+
+    def plotPositions(self, indices):
+        """
+        Return the positions in the plot data of the TOAs with the given
+        (sorted) indices. TOAs that are not plotted are left out. With
+        binning, a bin is at the position of any of its TOAs
+        """
+        indices = np.asarray(indices, dtype=int)
+        if self.plotIndex is None:
+            return np.zeros(0, dtype=int)
+        if self.plotBins is not None:
+            groups = self.plotBins.group[indices]
+            indices = np.unique(self.plotBins.first[groups[groups >= 0]])
+        pos = np.searchsorted(self.plotIndex, indices)
+        valid = pos < len(self.plotIndex)
+        pos = pos[valid]
+        return pos[self.plotIndex[pos] == indices[valid]]
+
+    def renderOverlay(self):
+        """
+        Set the data of the overlay artists: the highlighted points, the
+        point under the cursor, and the START/FINISH markers. Call
+        plkOverlay.update() to show them without a full redraw
+        """
+        if self.plotData is not None:
+            x, y, yerr = self.plotData
+            hl = self.plotPositions(self.highlighted)
+            self.plkHighlight.set_data(x[hl], y[hl])
+            hv = self.plotPositions([] if self.hoverIndex is None \
+                    else [self.hoverIndex])
+            self.plkHover.set_data(x[hv], y[hv])
+
+        mx = np.array([m for m in self.zoomMarkers if m is not None], \
+                dtype=np.float64)
+        nan = np.full(len(mx), np.nan)
+        self.plkZoomMarkers.set_data(np.column_stack([mx, mx, nan]).ravel(), \
+                np.column_stack([np.zeros(len(mx)), np.ones(len(mx)), nan]).ravel())
+
+    def plotGridScan(self, params, grids, chi2):
+        """
+        Replace the residual plot with the result of a chi^2 grid scan: a
+        curve of delta chi^2 for one parameter, or contours at the 1, 2 and 3
+        sigma levels for two parameters. The next updatePlot restores the
+        residual plot
+
+        @param params:  Names of the scanned parameters
+        @param grids:   One array of values per parameter
+        @param chi2:    The chi^2 values, as returned by Pulsar.grid_scan
+        """
+        self.drawSomething()
+        self.plkScanShown = True
+        self.setColorScheme(True)
+        dchi2 = chi2 - np.nanmin(chi2)
+        if len(params) == 1:
+            self.plkAxes.plot(grids[0], dchi2, 'b-')
+            self.plkAxes.set_xlabel(params[0])
+            self.plkAxes.set_ylabel(r'$\Delta\chi^2$')
+        else:
+            levels = [2.30, 6.18, 11.83]
+            self.plkAxes.contour(grids[0], grids[1], dchi2.T, levels=levels, \
+                    colors=['b', 'g', 'r'])
+            self.plkAxes.set_xlabel(params[0])
+            self.plkAxes.set_ylabel(params[1])
+        self.plkAxes.set_title(r'$\chi^2$ scan')
+        self.plkCanvas.draw()
+        self.setColorScheme(False)
+
+    def setHighlighted(self, indices):
+        """
+        Set which TOAs are highlighted
+
+        @param indices:     TOA indices of the highlighted points
+        """
+        self.highlighted = np.unique(np.asarray(indices, dtype=int))
+        self.renderOverlay()
+        self.plkOverlay.update()
+
+    def plotLimitsChanged(self, axes):
+        """
+        Callback for when the x-limits of the plot change. Re-decimates the
+        plot data for the new range
+        """
+        if not self.plkUpdating and self.plkPyramid is not None:
+            self.renderPlotData()
+            self.plkCanvas.draw_idle()
 
     def plotPhaseJumps(self, phasejumps):
         """
-        Plot the phase jump lines, if we have any
+        Plot the phase jump lines, if we have any. Lines of a previous plot are
+        removed first
         """
+        for artist in self.plkJumpArtists:
+            artist.remove()
+        self.plkJumpArtists = []
+
         xmin, xmax, ymin, ymax = self.plkAxes.axis()
         dy = 0.01 * (ymax-ymin)
 
@@ -802,28 +1366,106 @@ class PlkWidget(QtGui.QWidget):
 
             for ii in range(len(phasejumps)):
                 if phasejumps[ii,1] != 0:
-                    self.plkAxes.vlines(phasejumps[ii,0], ymin, ymax,
+                    lines = self.plkAxes.vlines(phasejumps[ii,0], ymin, ymax,
                             color='darkred', linestyle='--', linewidth=0.5)
 
                     if phasejumps[ii,1] < 0:
-                        jstr = str(phasejumps[ii,1])
+                        jstr = str(int(phasejumps[ii,1]))
                     else:
-                        jstr = '+' + str(phasejumps[ii,1])
+                        jstr = '+' + str(int(phasejumps[ii,1]))
 
                     # Print the jump size above the plot
                     ann = self.plkAxes.annotate(jstr, \
                             xy=(phasejumps[ii,0], ymax+dy), xycoords='data', \
                             annotation_clip=False, color='darkred', \
                             size=7.0)
+                    self.plkJumpArtists += [lines, ann]
                     
 
+    def plotEpochs(self, xid, x):
+        """
+        Draw the observation overlays: lines between the plotted points of
+        every observation, and a vertical line at the start of every
+        observation in the plot (for time-like x-axes only). Both are single
+        artists, with NaNs separating the segments
+
+        @param xid:     ID of the x-axis
+        @param x:       x-values of all TOAs
+        """
+        epochs = self.psr.epochs
+        xp, yp, yerrp = self.plotData
+
+        if self.joinPoints:
+            lx, ly = epochs.polyline(self.plotIndex, xp, yp)
+            if self.plkJoinLine is None:
+                self.plkJoinLine = self.plkAxes.plot(lx, ly, color='blue', \
+                        linewidth=0.5, zorder=1)[0]
+            else:
+                self.plkJoinLine.set_data(lx, ly)
+        elif self.plkJoinLine is not None:
+            self.plkJoinLine.remove()
+            self.plkJoinLine = None
+
+        if self.indicateEpochs and xid in ['mjd', 'year', 'rounded MJD']:
+            shown = np.unique(epochs.epoch[self.plotIndex])
+            ex = np.asarray(getattr(x, 'value', x), dtype=np.float64)
+            ex = ex[epochs.first[shown]]
+            nan = np.full(len(ex), np.nan)
+            lx = np.column_stack([ex, ex, nan]).ravel()
+            ly = np.column_stack([np.zeros(len(ex)), np.ones(len(ex)), nan]).ravel()
+            if self.plkEpochLines is None:
+                # x in data coordinates, y spans the axes
+                trans = mtransforms.blended_transform_factory( \
+                        self.plkAxes.transData, self.plkAxes.transAxes)
+                self.plkEpochLines = self.plkAxes.plot(lx, ly, color='grey', \
+                        linestyle=':', linewidth=0.5, transform=trans, \
+                        scalex=False, scaley=False)[0]
+            else:
+                self.plkEpochLines.set_data(lx, ly)
+        elif self.plkEpochLines is not None:
+            self.plkEpochLines.remove()
+            self.plkEpochLines = None
+
+    def setZoomLimits(self, start, finish):
+        """
+        Set the zoom range on the pulsar, and move the START/FINISH markers
+        along. The pulsar notifies us, so the plot is redrawn
+
+        @param start:   START (MJD), or None for no lower limit
+        @param finish:  FINISH (MJD), or None for no upper limit
+        """
+        self.psr.set_zoom_limits(start, finish)
+        self.zoomMarkers = [start, finish]
+        self.renderOverlay()
+        self.scheduleRedraw()
+
     def setFocusToCanvas(self):
         """
         Set the focus to the plk Canvas
         """
         self.plkCanvas.setFocus()
 
-    def coord2point(self, cx, cy, which='xy'):
+    def pointIndex(self):
+        """
+        Return the spatial index of the plotted points. It is built once per
+        plot, and only rebuilt when the aspect ratio of the visible range
+        changes, since that changes what 'nearest' means on screen
+
+        @return:    PointIndex, or None if nothing is plotted
+        """
+        if self.plotData is None:
+            return None
+
+        xmin, xmax, ymin, ymax = self.plkAxes.axis()
+        xspan, yspan = clamp_span(xmax-xmin), clamp_span(ymax-ymin)
+        aspect = np.log(xspan / yspan)
+        if self.plkIndex is None or abs(aspect - self.plkIndexAspect) > 0.1:
+            x, y, yerr = self.plotData
+            self.plkIndex = PointIndex(x, y, xspan, yspan)
+            self.plkIndexAspect = aspect
+        return self.plkIndex
+
+    def coord2point(self, cx, cy, which='xy', maxdist=None):
         """
         Given data coordinates x and y, obtain the index of the observations
         that is closest to it
@@ -831,39 +1473,78 @@ class PlkWidget(QtGui.QWidget):
         @param cx:      x-value of the coordinates
         @param cy:      y-value of the coordinates
         @param which:   which axis to include in distance measure [xy/x/y]
+        @param maxdist: If set, maximum distance as a fraction of the visible
+                        range
         
         @return:    Index of observation
         """
         ind = None
 
-        if self.psr is not None:
-            # Get a mask for the plotting points
-            msk = self.psr.mask('plot')
+        index = self.pointIndex()
+        if self.psr is not None and index is not None:
+            if maxdist is not None:
+                # The index normalises by the spans it was built with
+                xmin, xmax, ymin, ymax = self.plkAxes.axis()
+                maxdist = maxdist * clamp_span(xmax-xmin) / index.xspan
 
-            # Get the IDs of the X and Y axis
-            xid, yid = self.xyChoiceWidget.plotids()
+            pos = index.nearest(cx, cy, which=which, maxdist=maxdist)
+            if pos is not None:
+                ind = self.plotIndex[pos]
 
-            # Retrieve the data
-            x, xerr, xlabel = self.psr.data_from_label(xid)
-            y, yerr, ylabel = self.psr.data_from_label(yid)
+        return ind
 
-            if np.sum(msk) > 0 and x is not None and y is not None:
-                # Obtain the limits
-                xmin, xmax, ymin, ymax = self.plkAxes.axis()
+    def points2toas(self, positions):
+        """
+        Convert positions in the plot data to TOA indices (all TOAs of the
+        bins, with binning)
+        """
+        return self.groupIndices(self.plotIndex[positions])
 
-                if which == 'xy':
-                    dist = ((x[msk]-cx)/(xmax-xmin))**2 + ((y[msk]-cy)/(ymax-ymin))**2
-                elif which == 'x':
-                    dist = ((x[msk]-cx)/(xmax-xmin))**2
-                elif which == 'y':
-                    dist = ((y[msk]-cy)/(ymax-ymin))**2
-                else:
-                    raise ValueError("Value {0} not a valid option for coord2point".format(which))
+    def identifyPoint(self, ind):
+        """
+        Return a description of a TOA, or of its bin when binned
 
-                ind = np.arange(len(x))[msk][np.argmin(dist)]
+        @param ind:     Index of the TOA
+        """
+        pos = np.searchsorted(self.plotIndex, ind)
+        x, y, yerr = self.plotData
+        if self.plotBins is not None:
+            inds = self.groupIndices([ind])
+            return "Bin of {0} TOAs from TOA {1}: MJD {2:.6f}-{3:.6f}, err {4:.3f} us ({5:.8g}, {6:.8g})".format( \
+                    len(inds), inds[0], \
+                    np.min(self.psr.stoas[inds].value), \
+                    np.max(self.psr.stoas[inds].value), \
+                    self.plotBins.error[self.plotBins.group[ind]], x[pos], y[pos])
+        return "TOA {0}: MJD {1:.6f}, {2:.3f} MHz, err {3:.3f} us ({4:.8g}, {5:.8g})".format( \
+                ind, self.psr.stoas[ind].value, self.psr.freqs[ind].value, \
+                self.psr.toaerrs[ind].value, x[pos], y[pos])
+
+    def highlightRect(self, x0, x1, y0, y1, add=True):
+        """
+        Highlight all plotted points within a rectangle
 
-        return ind
+        @param add:     If True, add to the current highlighted points
+        """
+        index = self.pointIndex()
+        if index is not None:
+            inds = self.points2toas(index.in_rect(x0, x1, y0, y1))
+            if add:
+                inds = np.union1d(self.highlighted, inds)
+            self.setHighlighted(inds)
+
+    def highlightLasso(self, vertices, add=True):
+        """
+        Highlight all plotted points within a polygon
 
+        @param vertices:    (n, 2) array of polygon vertices, in data coordinates
+        @param add:         If True, add to the current highlighted points
+        """
+        index = self.pointIndex()
+        if index is not None:
+            inds = self.points2toas(index.in_lasso(vertices))
+            if add:
+                inds = np.union1d(self.highlighted, inds)
+            self.setHighlighted(inds)
 
     def keyPressEvent(self, event, **kwargs):
         """
@@ -935,43 +1616,46 @@ class PlkWidget(QtGui.QWidget):
                 self.fitboxVisible = True
                 self.actionsVisible = False
             self.showVisibleWidgets()
-        elif ukey == ord('s'):
-            # Set START flag at xpos
-            # TODO: propagate back to the IPython shell
-            self.psr['START'].set = True
-            self.psr['START'].fit = True
-            self.psr['START'].val = xpos
-            self.updatePlot()
-        elif ukey == ord('f'):
-            # Set FINISH flag as xpos
-            # TODO: propagate back to the IPython shell
-            self.psr['FINISH'].set = True
-            self.psr['FINISH'].fit = True
-            self.psr['FINISH'].val = xpos
-            self.updatePlot()
+        elif ukey == ord('s') or ukey == ord('f'):
+            # Set START ('s') or FINISH ('f') of the zoom range at xpos
+            xid, yid = self.plotIds()
+            if xpos is None or xid not in ['mjd', 'rounded MJD']:
+                print("WARNING: zoom limits can only be set on an MJD axis")
+            else:
+                start, finish = self.psr.zoom_limits()
+                if ukey == ord('s'):
+                    start = xpos
+                else:
+                    finish = xpos
+                self.setZoomLimits(start, finish)
         elif ukey == ord('u'):
             # Unzoom
-            # TODO: propagate back to the IPython shell
-            self.psr['START'].set = True
-            self.psr['START'].fit = False
-            self.psr['START'].val = np.min(self.psr.toas)
-            self.psr['FINISH'].set = True
-            self.psr['FINISH'].fit = False
-            self.psr['FINISH'].val = np.max(self.psr.toas)
-            self.updatePlot()
+            self.setZoomLimits(None, None)
+        elif ukey == ord('b'):
+            # Bin TOAs within a time bin
+            binsize, ok = QtGui.QInputDialog.getDouble(self, 'Bin TOAs', \
+                    'Bin size (days, 0 for no binning):', \
+                    1.0 if self.binSize is None else self.binSize, 0.0, 1.0e5, 3)
+            if ok:
+                self.binSize = binsize if binsize > 0 else None
+                self.scheduleRedraw()
+        elif ukey == ord('j'):
+            # Draw lines between the points of every observation
+            self.joinPoints = not self.joinPoints
+            self.scheduleRedraw()
+        elif ukey == ord('I'):
+            # Indicate individual observations
+            self.indicateEpochs = not self.indicateEpochs
+            self.scheduleRedraw()
         elif ukey == ord('d'):
             # Delete data point
             # TODO: propagate back to the IPython shell
-            # TODO: Fix libstempo!
             ind = self.coord2point(xpos, ypos)
-            #print("Deleted:", self.psr._psr.deleted)
-            # TODO: fix this hack properly in libstempo
-            tempdel = self.psr.deleted
-            tempdel[ind] = True
-            self.psr.deleted = tempdel
-            self.updatePlot()
-            #print("Index deleted = ", ind)
-            #print("Deleted:", self.psr.deleted[ind])
+            if ind is not None:
+                tempdel = self.psr.deleted
+                tempdel[self.groupIndices([ind])] = True
+                self.psr.deleted = tempdel
+                self.scheduleRedraw()
         elif ukey == ord('+') or ukey == ord('-'):
             # Add/delete a phase jump
             jump = 1
@@ -979,91 +1663,42 @@ class PlkWidget(QtGui.QWidget):
                 jump = -1
 
             ind = self.coord2point(xpos, ypos, which='x')
-            self.psr.add_phasejump(self.psr.stoas[ind], jump)
-            self.updatePlot()
+            if ind is not None:
+                self.psr.add_phasejump(self.psr.stoas[ind].value, jump)
+                self.scheduleRedraw()
         elif ukey == QtCore.Qt.Key_Backspace:
             # Remove all phase jumps
             self.psr.remove_phasejumps()
-            self.updatePlot()
+            self.scheduleRedraw()
         elif ukey == ord('<'):
-            # Add a data point to the view on the left
-            # TODO: Make this more Pythonic!
-            if self.psr['START'].set and self.psr['START'].fit:
-                start = self.psr['START'].val
-                ltmask = self.psr.stoas < start
-
-                if np.sum(ltmask) > 2:
-                    ltind = np.arange(len(self.psr.stoas))[ltmask]
-                    lttoas = self.psr.stoas[ltmask]
-                    max_ltind = np.argmax(lttoas)
-
-                    # Get maximum of selected TOAs
-                    ltmax = ltind[max_ltind]
-                    start_max = self.psr.stoas[ltmax]
-
-                    # Get second-highest TOA value
-                    ltmask[ltmax] = False
-                    ltind = np.arange(len(self.psr.stoas))[ltmask]
-                    lttoas = self.psr.stoas[ltmask]
-                    max_ltind = np.argmax(lttoas)
-                    ltmax = ltind[max_ltind]
-                    start_max2 = self.psr.stoas[ltmax]
-
-                    # Set the new START value
-                    self.psr['START'].val = 0.5 * (start_max + start_max2)
-                elif np.sum(ltmask) == 2:
-                    idmin = np.argmin(self.psr.stoas)
-                    stmin = self.psr.stoas[idmin]
-                    mask = np.ones(len(self.psr.stoas), dtype=np.bool)
-                    mask[idmin] = False
-                    self.psr['START'].val = 0.5 * \
-                            (np.min(self.psr.stoas[mask]) + stmin)
-                elif np.sum(ltmask) == 1:
-                    self.psr['START'].val = np.min(self.psr.stoas) - 1
-                elif np.sum(ltmask) == 0:
-                    pass
-                self.updatePlot()
+            # In zoom mode, include the previous observation
+            start, finish = self.psr.zoom_limits()
+            if start is not None:
+                start = self.psr.zoom_step(start, -1)
+                if start is not None:
+                    self.setZoomLimits(start, finish)
         elif ukey == ord('>'):
-            # Add a data point to the view on the left
-            # TODO: Make this more Pythonic!
-            if self.psr['FINISH'].set and self.psr['FINISH'].fit:
-                start = self.psr['FINISH'].val
-                gtmask = self.psr.stoas > start
-
-                if np.sum(gtmask) > 2:
-                    gtind = np.arange(len(self.psr.stoas))[gtmask]
-                    gttoas = self.psr.stoas[gtmask]
-                    min_gtind = np.argmin(gttoas)
-
-                    # Get maximum of selected TOAs
-                    gtmin = gtind[min_gtind]
-                    start_min = self.psr.stoas[gtmin]
-
-                    # Get second-highest TOA value
-                    gtmask[gtmin] = False
-                    gtind = np.arange(len(self.psr.stoas))[gtmask]
-                    gttoas = self.psr.stoas[gtmask]
-                    min_gtind = np.argmin(gttoas)
-                    gtmin = gtind[min_gtind]
-                    start_min2 = self.psr.stoas[gtmin]
-
-                    # Set the new FINISH value
-                    self.psr['FINISH'].val = 0.5 * (start_min + start_min2)
-                elif np.sum(gtmask) == 2:
-                    idmax = np.argmax(self.psr.stoas)
-                    stmax = self.psr.stoas[idmax]
-                    mask = np.ones(len(self.psr.stoas), dtype=np.bool)
-                    mask[idmax] = False
-                    self.psr['FINISH'].val = 0.5 * \
-                            (np.max(self.psr.stoas[mask]) + stmax)
-                elif np.sum(gtmask) == 1:
-                    self.psr['FINISH'].val = np.max(self.psr.stoas) + 1
-                elif np.sum(gtmask) == 0:
-                    pass
-                self.updatePlot()
+            # In zoom mode, include the next observation
+            start, finish = self.psr.zoom_limits()
+            if finish is not None:
+                finish = self.psr.zoom_step(finish, 1)
+                if finish is not None:
+                    self.setZoomLimits(start, finish)
         elif ukey == ord('x'):
             # Re-do the fit, using post-fit values of the parameters
             self.reFit()
+        elif ukey == ord('i'):
+            # Identify the point under the cursor
+            ind = self.coord2point(xpos, ypos)
+            if ind is not None:
+                print(self.identifyPoint(ind))
+        elif ukey == ord('o'):
+            # Highlight all points currently in the plot
+            xmin, xmax, ymin, ymax = self.plkAxes.axis()
+            self.highlightRect(xmin, xmax, ymin, ymax)
+        elif ukey == ord('U'):
+            # Unhighlight all points
+            self.setHighlighted([])
         elif ukey == QtCore.Qt.Key_Left:
             # print("Left pressed")
             pass
@@ -1085,9 +1720,78 @@ class PlkWidget(QtGui.QWidget):
         """
         When one clicks on the Figure/Canvas, this function is called. The
         coordinates of the click are stored in event.xdata, event.ydata
+
+        A left-button drag selects (highlights) points: a rectangle by
+        default, or a lasso when shift is held
         """
         #print('Canvas click, you pressed', event.button, event.xdata, event.ydata)
-        pass
+        if event.button == 1 and event.inaxes is self.plkAxes:
+            self.plkSelection = [(event.xdata, event.ydata)]
+
+    def canvasMotionEvent(self, event):
+        """
+        The mouse moves over the Canvas. Extend the selection if we are
+        dragging, otherwise identify the point under the cursor
+        """
+        if event.inaxes is not self.plkAxes:
+            return
+
+        if self.plkSelection is not None:
+            self.plkSelection.append((event.xdata, event.ydata))
+            lasso = event.key is not None and 'shift' in event.key
+            self.renderRubberBand(self.plkSelection, lasso)
+            self.plkOverlay.update()
+        elif self.psr is not None:
+            ind = self.coord2point(event.xdata, event.ydata, maxdist=0.01)
+            if ind != self.hoverIndex:
+                self.hoverIndex = ind
+                if ind is None:
+                    self.plkCanvas.setToolTip('')
+                else:
+                    self.plkCanvas.setToolTip(self.identifyPoint(ind))
+                self.renderOverlay()
+                self.plkOverlay.update()
+
+    def renderRubberBand(self, selection, lasso=False):
+        """
+        Show the selection in progress: the rectangle between the first and
+        the last point, or the lasso through all points
+
+        @param selection:   List of (x, y) data coordinates, or None to hide
+        @param lasso:       Whether the selection is a lasso
+        """
+        if selection is None:
+            self.plkRubberBand.set_data([], [])
+        elif lasso:
+            sx, sy = zip(*(selection + selection[:1]))
+            self.plkRubberBand.set_data(sx, sy)
+        else:
+            (x0, y0), (x1, y1) = selection[0], selection[-1]
+            self.plkRubberBand.set_data([x0, x1, x1, x0, x0], [y0, y0, y1, y1, y0])
+
+    def canvasReleaseEvent(self, event):
+        """
+        A mouse button is released. Finish the selection, or identify the point
+        if the mouse did not move
+        """
+        if self.plkSelection is None:
+            return
+        selection, self.plkSelection = self.plkSelection, None
+        self.renderRubberBand(None)
+        self.plkOverlay.update()
+
+        if event.inaxes is self.plkAxes:
+            selection.append((event.xdata, event.ydata))
+        (x0, y0), (x1, y1) = selection[0], selection[-1]
+
+        if len(selection) <= 2 and x0 == x1 and y0 == y1:
+            ind = self.coord2point(x0, y0)
+            if ind is not None:
+                print(self.identifyPoint(ind))
+        elif event.key is not None and 'shift' in event.key:
+            self.highlightLasso(selection)
+        else:
+            self.highlightRect(x0, x1, y0, y1)
 
     def canvasKeyEvent(self, event):
         """
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+plkrender: Fast renderers for the plk residual plot
+
+matplotlib's errorbar creates a number of artists, and checks and converts its
+input on every call. For large TOA sets we want exactly two artists: one for
+all the points, and one for all the error bars, with their data built by numpy
+in one go.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Importing all the stuff for the matplotlib widget
+from matplotlib.lines import Line2D
+
+# Numpy etc.
+import numpy as np
+
+
+class ErrorbarRenderer(object):
+    """
+    Draws points with vertical error bars using two artists:
+
+    - the points are a single Line2D without a line, so matplotlib stamps the
+      same marker at all positions
+    - the error bars are a single Line2D as well, with NaN separators between
+      the bars, so that they form one path that is drawn in one call
+
+    The vertex buffer of the error bars is re-used between updates
+    """
+
+    def __init__(self, axes, color='blue', marker='.', markersize=6.0, \
+            linewidth=1.0):
+        """
+        @param axes:        The matplotlib Axes to draw in
+        @param color:       Color of the points and the error bars
+        @param marker:      Marker of the points
+        @param markersize:  Size of the markers
+        @param linewidth:   Line width of the error bars
+        """
+        self.axes = axes
+
+        self.points = Line2D([], [], linestyle='none', marker=marker, \
+                markersize=markersize, color=color)
+        self.bars = Line2D([], [], linestyle='-', linewidth=linewidth, \
+                color=color)
+        axes.add_line(self.bars)
+        axes.add_line(self.points)
+
+        self._barbuf = np.empty((0, 2))
+
+    def set_data(self, x, y, yerr=None):
+        """
+        Replace the data of the plot
+
+        @param x:       x-coordinates (float array)
+        @param y:       y-coordinates (float array)
+        @param yerr:    symmetric error bars on y, or None for no error bars
+        """
+        self.points.set_data(x, y)
+
+        if yerr is None:
+            self.bars.set_data([], [])
+            self.bars.set_visible(False)
+            return
+
+        # Every bar is (x, y-err), (x, y+err), (nan, nan)
+        n = len(x)
+        if len(self._barbuf) < 3*n:
+            self._barbuf = np.empty((3*n, 2))
+        buf = self._barbuf[:3*n].reshape((n, 3, 2))
+        buf[:,0,0] = x
+        buf[:,0,1] = y - yerr
+        buf[:,1,0] = x
+        buf[:,1,1] = y + yerr
+        buf[:,2,:] = np.nan
+        flat = self._barbuf[:3*n]
+        self.bars.set_data(flat[:,0], flat[:,1])
+        self.bars.set_visible(True)
+
+    def set_visible(self, visible):
+        self.points.set_visible(visible)
+        self.bars.set_visible(visible and len(self.bars.get_xdata()) > 0)
+
+    def remove(self):
+        """
+        Remove the artists from the axes
+        """
+        self.points.remove()
+        self.bars.remove()
@@ -1,12 +1,23 @@
 from __future__ import print_function
 from __future__ import division
 import os, sys
+import numbers
 
 # Numpy etc.
 import numpy as np
 import time
 import tempfile
 from constants import J1744_parfile, J1744_timfile, J1744_parfile_basic 
+import toacache
+from toastore import TOAStore
+from fitting import IncrementalFitter
+from dmcache import DesignMatrixCache, model_values
+import scan
+import connect
+import binning
+import epochs
+import skyaxes
+import caldates
 
 # For date conversions
 import astropy.units as u
@@ -15,6 +26,10 @@ from astropy.time import Time
 import pint.models as pm
 from pint.phase import Phase
 from pint import toa
+try:
+    from pint.models.noise_model import NoiseComponent
+except ImportError:
+    NoiseComponent = ()
 import pint.fitter
 import pint.residuals
         
@@ -32,13 +47,79 @@ plot_labels = ['pre-fit', 'post-fit', 'mjd', 'year', 'orbital phase', 'serial',
 nofitboxpars = ['PSR', 'START', 'FINISH', 'POSEPOCH', 'PEPOCH', 'DMEPOCH', \
     'EPHVER', 'TZRMJD', 'TZRFRQ', 'TRES']
 
+# What the data of each plot label depends on. Cached data is only recomputed
+# when one of these has changed
+label_dependencies = {
+    'pre-fit': ['toas', 'mask', 'phasejumps'],
+    'post-fit': ['toas', 'fit', 'mask', 'phasejumps'],
+    'mjd': ['toas'],
+    'year': ['toas'],
+    'orbital phase': ['toas', 'model'],
+    'serial': ['toas'],
+    'day of year': ['toas'],
+    'frequency': ['toas'],
+    'TOA error': ['toas'],
+    'elevation': ['toas', 'model'],
+    'rounded MJD': ['toas'],
+    'sidereal time': ['toas'],
+    'hour angle': ['toas', 'model'],
+    'para. angle': ['toas', 'model'],
+    'preview': ['toas', 'fit', 'fitset', 'mask', 'phasejumps']}
+
+# All aspects of the state of a pulsar, see Pulsar.version
+dependency_aspects = ['toas', 'model', 'fitset', 'fit', 'mask', 'phasejumps']
+
+# Phase jumps are kept as a sorted array of (MJD, jump in pulse periods)
+phasejump_dtype = [('mjd', np.float64), ('jump', np.int64)]
+
+# The stages of loading a pulsar, as reported to the progress callback
+load_stages = ['model', 'toas', 'clock', 'residuals', 'fitter']
+load_stage_descriptions = {
+    'model': 'Parsing timing model',
+    'toas': 'Reading TOAs',
+    'clock': 'Applying clock corrections',
+    'residuals': 'Computing residuals',
+    'fitter': 'Setting up fitter'}
+
+def _same_state(a, b):
+    '''Whether two dependency-state tokens are the same'''
+    if a is b:
+        return True
+    try:
+        return bool(a == b)
+    except (ValueError, TypeError):
+        return False
+
+def same_state(a, b):
+    '''Whether two tuples of dependency-state tokens are the same'''
+    return a is not None and b is not None and len(a) == len(b) and \
+            all(_same_state(x, y) for x, y in zip(a, b))
+
 class Pulsar(object):
     '''
     Wrapper class for a pulsar. Contains the toas, model, residuals, and fitter
     '''
 
-    def __init__(self, parfile=None, timfile=None, testpulsar=False):
+    def __init__(self, parfile=None, timfile=None, testpulsar=False, \
+            usecache=True, progress=None):
+        '''
+        @param parfile:     The parfile to load
+        @param timfile:     The timfile to load
+        @param testpulsar:  If True, load the built-in test pulsar (J1744)
+        @param usecache:    Whether to use the on-disk cache of processed TOAs
+        @param progress:    Callback function, called with the name of each
+                            of the load_stages. It may raise to abort loading
+        '''
         super(Pulsar, self).__init__()
+
+        # Cache of data_from_label: label -> (dependency state, data)
+        self._labelcache = {}
+
+        # Version counter and last seen token of every aspect, and the
+        # callbacks to notify of changes: (callback, aspects or None)
+        self._versions = dict((aspect, 0) for aspect in dependency_aspects)
+        self._tokens = {}
+        self._subscribers = []
         
         print('STARTING LOADING OF PULSAR %s' % str(parfile))
         
@@ -58,6 +139,21 @@ class Pulsar(object):
         else:
             raise ValueError("No valid pulsar to load")
 
+        try:
+            self._load(parfilename, timfilename, usecache, progress)
+        finally:
+            if testpulsar:
+                os.remove(parfilename)
+                os.remove(timfilename)
+
+    def _load(self, parfilename, timfilename, usecache, progress):
+        '''
+        Load the model and the TOAs, and set up the residuals and the fitter
+        '''
+        if progress is None:
+            progress = lambda stage: None
+
+        progress('model')
         self._model = pm.get_model(parfilename)
         print("model.as_parfile():")
         print(self._model.as_parfile())
@@ -69,18 +165,30 @@ class Pulsar(object):
         except AttributeError:
             planet_ephemes = False
 
-        self._toas = toa.get_TOAs(timfilename)
+        # Processed TOAs are re-used from the on-disk cache when possible.
+        # Reports the 'toas' and 'clock' stages itself
+        self._toas = toacache.get_TOAs(timfilename, usecache=usecache, \
+                progress=progress)
         self._toas.print_summary()
+        self._store = TOAStore(self._toas)
+        self._deleted = np.zeros(self._store.ntoas, dtype=bool)
+        self._phasejumps = np.zeros(0, dtype=phasejump_dtype)
+        self._bincache = None
+        self._epochcache = None
+        self._skycache = None
 
+        progress('residuals')
         self._resids = pint.residuals.resids(self._toas, self._model)
         self._prefit_resids = self._resids.time_resids
         print("RMS PINT residuals are %.3f us\n" % \
               self._prefit_resids.std().to(u.us).value)
-        self._fitter = pint.fitter.WlsFitter(self._toas, self._model)
 
-        if testpulsar:
-            os.remove(parfilename)
-            os.remove(timfilename)
+        progress('fitter')
+        self._dmcache = DesignMatrixCache(self._toas)
+        self._fitter = IncrementalFitter(self._toas, self._model, \
+                dmcache=self._dmcache)
+        self._tokens = dict((aspect, self._aspect_token(aspect)) \
+                for aspect in dependency_aspects)
 
     @property
     def name(self):
@@ -121,6 +229,23 @@ class Pulsar(object):
                          if not getattr(self._model, p).quantity is None]
         return ret
 
+    def fittable_params(self):
+        """
+        Return the names of the timing parameters that can be fitted for:
+        those set in the parfile that get a fit checkbox, with a numeric value,
+        and not part of a noise component
+        """
+        params = []
+        for comp, pars in self.compsSetParamsDict.items():
+            if isinstance(self._model.components[comp], NoiseComponent):
+                continue
+            for p in pars:
+                value = getattr(self._model, p).value
+                if p not in nofitboxpars and isinstance(value, numbers.Real) \
+                        and not isinstance(value, (bool, np.bool_)):
+                    params.append(p)
+        return params
+
     @property
     def vals(self): 
         '''Returns a tuple of parameter values in the model'''
@@ -130,6 +255,7 @@ class Pulsar(object):
     def vals(self, values):
         for key, val in zip(self.params, values):
             getattr(self._model, key).value = val
+        self._changed('model')
 
     @property
     def fitvals(self):
@@ -141,6 +267,7 @@ class Pulsar(object):
         for key, val in zip(self.fitparams, values):
             getattr(self._model, key).value = val
         self._fitvals = values
+        self._changed('model')
 
     @property
     def setvals(self):
@@ -151,6 +278,7 @@ class Pulsar(object):
     def setvals(self, values):
         for key, val in zip(self.setparams, values):
             getattr(self._model, key).value = val
+        self._changed('model')
 
     @property
     def errs(self):
@@ -161,6 +289,7 @@ class Pulsar(object):
     def errs(self, values):
         for key, err in zip(self.params, values):
             getattr(self._model, key).uncertainty_value = err
+        self._changed('model')
 
     @property
     def fiterrs(self):
@@ -172,6 +301,7 @@ class Pulsar(object):
         for key, err in zip(self.fitparams, values):
             getattr(self._model, key).uncertainty_value = err
         self._fiterrs = values
+        self._changed('model')
         
     @property
     def seterrs(self, values):
@@ -183,43 +313,77 @@ class Pulsar(object):
 
     @property
     def deleted(self):
-        return np.zeros(self._toas.ntoas, dtype=np.bool)
+        '''Mask of deleted TOAs (a copy: assign to change it)'''
+        return self._deleted.copy()
 
     @deleted.setter
     def deleted(self, values):
-        pass
+        values = np.array(values, dtype=bool)
+        if values.shape != self._deleted.shape:
+            raise ValueError("Deletion mask has {0} elements, need {1}".format( \
+                    len(values), len(self._deleted)))
+        if np.array_equal(values, self._deleted):
+            return
+
+        self._deleted = values
+        # The fitter updates its normal equations for the changed TOAs
+        self._fitter.set_deleted(values)
+        self._changed('mask')
 
     @property
     def toas(self):
         '''Barycentric arrival times'''
-        return np.array([t.value for t in self._toas.table['tdb']]) * u.d
+        return self._store.view(self._store.tdb, u.d)
 
     @property
     def stoas(self):
         '''Site arrival times'''
-        return self._toas.get_mjds()
+        return self._store.view(self._store.mjd, u.d)
 
     @property
     def toaerrs(self):
         '''TOA uncertainties'''
-        return self._toas.get_errors()
+        return self._store.view(self._store.error, u.us)
 
     @property
     def freqs(self):
         '''Observing frequencies'''
-        return self._toas.table['freq'].quantity
+        return self._store.view(self._store.freq, u.MHz)
+
+    @property
+    def obs(self):
+        '''Observatory codes'''
+        return self._store.obs
+
+    def flagvals(self, flagID):
+        '''Values of flag flagID for all TOAs ('' where not set)'''
+        return self._store.flagvalues(flagID)
 
     @property
     def residuals(self, updatebats=True, formresiduals=True):
-        return self._fitter.resids.time_resids
+        return self._fitter.residuals() * u.s
 
     @property
     def prefitresiduals(self):
+        offsets = self._fitter.pulse_offsets
+        if np.any(offsets):
+            # Re-centred like the post-fit residuals (see
+            # IncrementalFitter.residuals)
+            weights = self._fitter.weights
+            dr = offsets / np.float64(self._model.F0.value)
+            dr = dr - np.sum(weights * dr) / np.sum(weights)
+            return self._prefit_resids + dr * u.s
         return self._prefit_resids
     
+    @property
+    def previewresiduals(self):
+        '''Linearised prediction of the post-fit residuals for the current fit set'''
+        return self._fitter.preview() * u.s
+
     @property
     def chisq(self):
-        return self._fitter.resids.chi2.value
+        '''Chi^2 of the post-fit residuals of the TOAs that are not deleted'''
+        return self._fitter.chi2
 
     @property
     def orbitalphase(self):
@@ -248,18 +412,49 @@ class Pulsar(object):
         '''
         Return the day of the year for all the TOAs of this pulsar
         '''
-        t = Time(self.stoas, format='mjd')
-        year = Time(np.floor(t.decimalyear), format='decimalyear')
-        return (t.mjd - year.mjd) * u.day
+        return caldates.day_of_year(self._store.mjd) * u.day
 
     @property
     def year(self):
-        t = Time(self.stoas, format='mjd')
-        return (t.decimalyear) * u.year
+        return caldates.decimal_year(self._store.mjd) * u.year
         
+    def sky_axes(self):
+        """
+        Sidereal time, hour angle, elevation and parallactic angle of the
+        pulsar at all TOAs, computed together in one vectorised pass. Cached
+        until the TOA set or the pulsar position changes
+
+        @return:    Dictionary of arrays, see skyaxes.sky_axes
+        """
+        pos = skyaxes.pulsar_position(self._model)
+        if self._skycache is not None:
+            cversion, cpos, caxes = self._skycache
+            if cversion == self.version('toas') and cpos == pos:
+                return caxes
+
+        axes = skyaxes.sky_axes(self._store.mjd, self._store.obs, *pos)
+        self._skycache = (self.version('toas'), pos, axes)
+        return axes
+
     @property
     def siderealt(self):
-        pass
+        '''Local mean sidereal time'''
+        return self.sky_axes()['sidereal time'] * u.hourangle
+
+    @property
+    def hourangle(self):
+        '''Hour angle of the pulsar'''
+        return self.sky_axes()['hour angle'] * u.hourangle
+
+    @property
+    def elevation(self):
+        '''Elevation of the pulsar'''
+        return self.sky_axes()['elevation'] * u.deg
+
+    @property
+    def parallacticangle(self):
+        '''Parallactic angle of the pulsar'''
+        return self.sky_axes()['para. angle'] * u.deg
 
     def generate_fitparams(self):
         self._fitpars = [p for p in self._model.params if not getattr(self._model, p).frozen]
@@ -270,21 +465,170 @@ class Pulsar(object):
             self._fiterrs[i] = getattr(self._model, self._fitpars[i]).uncertainty_value
 
     def set_fit_state(self, parchanged, newstate):
-        getattr(self._model, parchanged).frozen = not newstate
+        # The fitter keeps the design matrix columns of the other parameters
+        self._fitter.set_fit_state(parchanged, newstate)
         self.generate_fitparams()
+        self._changed('fitset')
+
+    @property
+    def fitmode(self):
+        '''Fit mode: 'wls' (weighted) or 'gls' (full noise covariance)'''
+        return self._fitter.mode
+
+    def set_fit_mode(self, mode):
+        """
+        Choose between weighted and generalised least-squares fitting. GLS
+        uses the EFAC/EQUAD, ECORR and red noise components of the model
+
+        @param mode:    'wls' or 'gls'
+        """
+        self._fitter.set_mode(mode)
+        self._changed('fit')
 
     def designmatrix(self, updatebats=True, fixunits=False):
-        raise NotImplementedError
-        return None
+        """
+        Return the design matrix of the fitted parameters, linearised at the
+        current (post-fit) model. The first column is the offset, the others
+        follow fitparams. Columns are in seconds per parameter unit, and are
+        cached until a model parameter value or the TOA set changes
+
+        @param updatebats:  Ignored (compatibility with libstempo)
+        @param fixunits:    Ignored (columns always have physical units)
+
+        @return:    (ntoas, 1 + nfit) array
+        """
+        M, params, units = self._dmcache.designmatrix(self._fitter.model, \
+                self._fitter.fitparams)
+        return M
     
+    @property
+    def epochs(self):
+        """
+        Index of the observations: TOAs of the same observatory and backend
+        ('be' flag), less than half a day apart. Built once per TOA set
+
+        @return:    EpochIndex
+        """
+        if self._epochcache is not None and \
+                self._epochcache[0] == self.version('toas'):
+            return self._epochcache[1]
+
+        keys = [self._store.obs]
+        if 'be' in self._store.flags:
+            keys.append(self._store.flagvalues('be'))
+        index = epochs.EpochIndex(self._store.mjd, keys=keys)
+        self._epochcache = (self.version('toas'), index)
+        return index
+
+    def bin_toas(self, binsize, freqbins=None, flag=None, mask=None):
+        """
+        Group the TOAs in time bins, for averaging. The groups are cached
+        until the TOA set, the mask or the arguments change
+
+        @param binsize:     Width of the time bins (days)
+        @param freqbins:    If set, edges of frequency bands (MHz); TOAs in
+                            different bands are not averaged together
+        @param flag:        If set, TOAs with different values of this flag
+                            are not averaged together
+        @param mask:        TOAs to use (default: all that are not deleted)
+
+        @return:    TOABins
+        """
+        if mask is None:
+            mask = np.logical_not(self._deleted)
+        key = (binsize, None if freqbins is None else tuple(freqbins), flag)
+        if self._bincache is not None:
+            ckey, cversion, cmask, cbins = self._bincache
+            if ckey == key and cversion == self.version('toas') and \
+                    np.array_equal(cmask, mask):
+                return cbins
+
+        keys = []
+        if freqbins is not None:
+            keys.append(np.digitize(self._store.freq, freqbins))
+        if flag is not None:
+            keys.append(np.unique(self._store.flagvalues(flag), \
+                    return_inverse=True)[1])
+        bins = binning.TOABins(self._store.mjd, self._store.error, binsize, \
+                keys=keys, mask=mask)
+        self._bincache = (key, self.version('toas'), np.array(mask), bins)
+        return bins
+
+    def binned_fit(self, binsize, freqbins=None, flag=None):
+        """
+        Quick, linearised fit on the binned TOAs, for exploring large data
+        sets. The model is not changed. Always weighted least-squares
+
+        @param binsize:     Width of the time bins (days)
+        @param freqbins:    If set, edges of frequency bands (MHz)
+        @param flag:        If set, only average TOAs with the same flag value
+
+        @return:    List of (parameter, change, uncertainty), and the chi^2
+        """
+        bins = self.bin_toas(binsize, freqbins=freqbins, flag=flag)
+        M, params, units = self._dmcache.designmatrix(self._fitter.model, \
+                self._fitter.fitparams)
+        # In the units of the TOA errors (us)
+        r = self._fitter.residuals() * 1e6
+        dx, errs, chi2 = binning.binned_fit(bins, M * 1e6, r)
+        print('Binned fit of %d bins of %d TOAs: chi2 = %.8g' % \
+                (bins.nbins, len(bins.order), chi2))
+        return [(p, d, e) for p, d, e in zip(params, dx, errs) \
+                if p != 'Offset'], chi2
+
+    def ftest_scan(self, candidates=None, processes=None, maxiter=1, \
+            progress=None, fork=True):
+        """
+        Fit the current fit set plus one candidate parameter, for every
+        candidate, in parallel. Report the chi^2 decrease and its F-test
+        significance
+
+        @param candidates:  Names of parameters to try (default: all set but
+                            not fitted parameters)
+        @param processes:   Number of worker processes (default: all cores)
+        @param maxiter:     Maximum number of iterations of every fit
+        @param progress:    If set, called as progress(ndone, nfits)
+        @param fork:        Whether worker processes may be forked (not when
+                            called from a thread)
+
+        @return:    List of (parameter, delta chi2, F, p-value), most
+                    significant first
+        """
+        return scan.ftest_scan(self, candidates=candidates, \
+                processes=processes, maxiter=maxiter, progress=progress, \
+                fork=fork)
+
+    def grid_scan(self, params, grids, method='auto', processes=None, maxiter=1, \
+            progress=None, fork=True):
+        """
+        Map chi^2 over a grid of values of one or two parameters, fitting the
+        other fitted parameters at every grid point. Small grids (a few
+        uncertainties) use the linearised chi^2, others full fits in parallel
+
+        @param params:      Names of the one or two parameters to scan
+        @param grids:       One array of values (in parameter units) per parameter
+        @param method:      'linear', 'full', or 'auto'
+        @param processes:   Number of worker processes (default: all cores)
+        @param maxiter:     Maximum number of iterations of every full fit
+        @param progress:    If set, called as progress(ndone, nfits)
+        @param fork:        Whether worker processes may be forked (not when
+                            called from a thread)
+
+        @return:    chi2 array, with chi2[i, j] at grids[0][i], grids[1][j]
+        """
+        return scan.grid_scan(self, params, grids, method=method, \
+                processes=processes, maxiter=maxiter, progress=progress, \
+                fork=fork)
+
     def write_fit_summary(self):
-        wrms = np.sqrt(self.chisq / self._toas.ntoas)
+        wrms = np.sqrt(self.chisq / self._fitter.ntoas)
         print('Post-Fit Chi2:\t\t%.8g us^2' % self.chisq)
         print('Post-Fit Weighted RMS:\t%.8g us' % wrms)
         print('%17s\t%16s\t%16s\t%16s\t%16s' % 
               ('Parameter', 'Pre-Fit', 'Post-Fit', 'Uncertainty', 'Difference'))
         print('-' * 112)
-        for key in self.fitparams:
+        # Not START and FINISH, which are 'fitted' to set the zoom range
+        for key in self._fitter.fitparams:
             post = getattr(self._fitter.model, key).quantity
             units = post.unit
             pre = getattr(self._model, key).quantity.to(units)
@@ -297,12 +641,17 @@ class Pulsar(object):
                                                              diff.value))
 
     def fit(self, iters=1):
-        #Re-initialize fitter (start fit from scratch)
-        self._fitter = pint.fitter.WlsFitter(self._toas, self._model)
-        wrms = np.sqrt(self.chisq / self._toas.ntoas)
+        # Continue from the previous solution, unless the pre-fit model was
+        # edited since (then start from scratch)
+        if self._fitter.model_init_changed():
+            self._fitter.reset_model()
+        wrms = np.sqrt(self.chisq / self._fitter.ntoas)
         print('Pre-Fit Chi2:\t\t%.8g us^2' % self.chisq)
         print('Pre-Fit Weighted RMS:\t%.8g us' % wrms)
-        self._fitter.fit_toas(maxiter=1)
+        self._fitter.fit_toas(maxiter=iters)
+        if iters > 1 and not self._fitter.converged:
+            print('WARNING: fit did not converge in %d iterations' % iters)
+        self._changed('fit')
         self.write_fit_summary()
     
     def rd_hms(self):
@@ -319,26 +668,225 @@ class Pulsar(object):
         pass
 
     def phasejumps(self):
-        return []
+        '''Returns a list of [MJD, jump] pairs, sorted by MJD'''
+        return [[float(mjd), int(jump)] for mjd, jump in self._phasejumps]
 
     def add_phasejump(self, mjd, phasejump):
-        pass
+        """
+        Add a phase jump of an integer number of pulse periods, to all TOAs
+        from the given MJD onwards. Jumps at the same MJD are combined
+
+        @param mjd:         MJD of the jump
+        @param phasejump:   Size of the jump, in pulse periods
+        """
+        mjd = np.float64(getattr(mjd, 'value', mjd))
+        jumps = self._phasejumps.copy()
+        ind = np.searchsorted(jumps['mjd'], mjd)
+        if ind < len(jumps) and jumps['mjd'][ind] == mjd:
+            jumps['jump'][ind] += int(phasejump)
+            if jumps['jump'][ind] == 0:
+                jumps = np.delete(jumps, ind)
+        else:
+            jumps = np.insert(jumps, ind, (mjd, int(phasejump)))
+        self._set_phasejumps(jumps)
 
     def remove_phasejumps(self):
-        pass
+        '''Remove all phase jumps'''
+        self._set_phasejumps(np.zeros(0, dtype=phasejump_dtype))
+
+    def _set_phasejumps(self, jumps):
+        """
+        Replace the phase jumps, and give the fitter the pulse number offset
+        of every TOA: the sum of all jumps at or before its MJD
+        """
+        self._phasejumps = jumps
+        cumjumps = np.concatenate([[0], np.cumsum(jumps['jump'])])
+        ind = np.searchsorted(jumps['mjd'], self._store.mjd, side='right')
+        self._fitter.set_pulse_offsets(cumjumps[ind])
+        self._changed('phasejumps')
+
+    def phase_connect(self, gaps=None, mingap=10.0, maxjump=2, beam=20, \
+            processes=None, maxiter=2):
+        """
+        Search for phase-connected solutions: integer pulse number offsets
+        at the gaps in the TOAs, pruned by linearised chi^2, with the
+        surviving candidates fitted in parallel
+
+        @param gaps:        MJDs at which to try offsets (default: after
+                            every gap longer than mingap)
+        @param mingap:      Minimum length of a gap (days)
+        @param maxjump:     Largest offset tried at a gap (pulse periods)
+        @param beam:        Maximum number of partial solutions kept per gap
+        @param processes:   Number of worker processes (default: all cores)
+        @param maxiter:     Maximum number of iterations of every final fit
+
+        @return:    List of (jumps, linearised chi2, chi2), best first, with
+                    jumps a list of (MJD, offset) pairs
+        """
+        return connect.phase_connect(self, gaps=gaps, mingap=mingap, \
+                maxjump=maxjump, beam=beam, processes=processes, \
+                maxiter=maxiter)
+
+    def apply_phase_connection(self, jumps, iters=1):
+        """
+        Add the phase jumps of a phase-connection solution, and fit
+
+        @param jumps:   List of (MJD, offset) pairs, as returned by
+                        phase_connect
+        @param iters:   Number of fit iterations
+        """
+        for mjd, jump in jumps:
+            if jump != 0:
+                self.add_phasejump(mjd, jump)
+        self.fit(iters)
 
     @property
     def nphasejumps(self):
-        return self._psr.nphasejumps
+        return len(self._phasejumps)
+
+    def _aspect_token(self, aspect):
+        """
+        Return a token that changes whenever the given aspect of the pulsar
+        changes, also when it is changed behind our back. Tokens hold on to
+        the objects they refer to, so they can be compared by identity
+
+        @param aspect:  toas, model, fitset, fit, mask, or phasejumps
+        """
+        if aspect == 'toas':
+            return self._store
+        elif aspect == 'model':
+            return model_values(self._model)
+        elif aspect == 'fitset':
+            return tuple(p for p in self._model.params \
+                    if not getattr(self._model, p).frozen)
+        elif aspect == 'fit':
+            return (self._fitter, self._fitter.resids, self._fitter.mode)
+        elif aspect == 'mask':
+            return self._deleted
+        elif aspect == 'phasejumps':
+            return self._phasejumps
+        raise ValueError("Unknown aspect {0}".format(aspect))
+
+    def version(self, aspect):
+        """
+        Return the version counter of an aspect of the pulsar. It increases
+        with every change of that aspect
+
+        @param aspect:  toas, model, fitset, fit, mask, or phasejumps
+        """
+        if aspect not in self._versions:
+            raise ValueError("Unknown aspect {0}".format(aspect))
+        return self._versions[aspect]
+
+    def dependency_state(self, aspect):
+        """
+        Return a token that changes whenever the given aspect of the pulsar
+        changes: its version counter
+
+        @param aspect:  toas, model, fitset, fit, mask, or phasejumps
+        """
+        return self.version(aspect)
+
+    def subscribe(self, callback, aspects=None):
+        """
+        Call callback(psr, changed) whenever one of the given aspects changes.
+        changed is the list of the aspects that changed
+
+        @param callback:    The callback function
+        @param aspects:     List of aspects to watch (default: all)
+        """
+        self.unsubscribe(callback)
+        self._subscribers.append((callback, \
+                None if aspects is None else set(aspects)))
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling callback on changes
+        """
+        self._subscribers = [(cb, asp) for cb, asp in self._subscribers \
+                if cb != callback]
+
+    def _changed(self, *aspects):
+        """
+        Record a change of the given aspects: increase their version counters,
+        and notify the subscribers. Edits of the pre-fit model are passed on
+        to the fitter first; if that resets the fit, 'fit' changes as well
+
+        @return:    List of the aspects that changed
+        """
+        if ('model' in aspects or 'fitset' in aspects) and \
+                self._fitter.sync_model_init() and 'fit' not in aspects:
+            aspects += ('fit',)
+
+        for aspect in aspects:
+            self._versions[aspect] += 1
+            self._tokens[aspect] = self._aspect_token(aspect)
+
+        for callback, watched in list(self._subscribers):
+            changed = [a for a in aspects if watched is None or a in watched]
+            if len(changed) == 0:
+                continue
+            try:
+                callback(self, changed)
+            except Exception as err:
+                print("WARNING: change callback failed: {0}".format(err))
+        return list(aspects)
+
+    def check_for_changes(self):
+        """
+        Detect changes that were made directly to the model or the fitter (from
+        the IPython kernel, or the ParEdit table), and record them like other
+        changes. Edits of model values and fit flags are passed on to the fitter
+
+        @return:    List of the aspects that changed
+        """
+        changed = [aspect for aspect in dependency_aspects if not \
+                _same_state(self._aspect_token(aspect), self._tokens.get(aspect))]
+
+        if 'fitset' in changed:
+            self.generate_fitparams()
+        if len(changed) > 0:
+            changed = self._changed(*changed)
+        return changed
+
+    def state_version(self):
+        """
+        Return a token of the complete state of the pulsar: a tuple of the
+        version counters of all aspects. Compare with same_state
+        """
+        return tuple(self.version(aspect) for aspect in dependency_aspects)
 
     def data_from_label(self, label):
         """
-        Given a label, return the data that corresponds to it
+        Given a label, return the data that corresponds to it. The data is
+        cached, and only recomputed when something it depends on has changed
+        (see label_dependencies). The returned arrays are read-only
 
         @param label:   The label of which we want to obtain the data
 
         @return:    data, error, plotlabel
         """
+        # Pick up changes made directly to the model first
+        self.check_for_changes()
+        deps = label_dependencies.get(label, ['toas', 'model', 'fit', 'mask'])
+        state = [self.dependency_state(dep) for dep in deps]
+
+        if label in self._labelcache:
+            cstate, cdata = self._labelcache[label]
+            if all(_same_state(c, s) for c, s in zip(cstate, state)):
+                return cdata
+
+        cdata = self._data_from_label(label)
+        for arr in cdata[:2]:
+            if arr is not None:
+                arr.flags.writeable = False
+        self._labelcache[label] = (state, cdata)
+        return cdata
+
+    def _data_from_label(self, label):
+        """
+        Compute the data of data_from_label, without caching
+        """
         data, error, plotlabel = None, None, None
 
         if label == 'pre-fit':
@@ -349,6 +897,10 @@ class Pulsar(object):
             data = self.residuals.to(u.us)
             error = self.toaerrs.to(u.us)
             plotlabel = r"Post-fit residual ($\mu$s)"
+        elif label == 'preview':
+            data = self.previewresiduals.to(u.us)
+            error = self.toaerrs.to(u.us)
+            plotlabel = r"Preview post-fit residual ($\mu$s)"
         elif label == 'mjd':
             data = self.stoas
             error = self.toaerrs.to(u.d)
@@ -380,21 +932,100 @@ class Pulsar(object):
         elif label == 'elevation':
             data = self.elevation
             error = None
-            plotlabel = 'Elevation'
+            plotlabel = 'Elevation (deg)'
         elif label == 'rounded MJD':
             # TODO: Do we floor, or round like this?
             data = np.floor(self.stoas + 0.5 * u.d)
             error = self.toaerrs.to(u.d)
             plotlabel = r'MJD'
         elif label == 'sidereal time':
-            print("WARNING: parameter {0} not yet implemented".format(label))
+            data = self.siderealt
+            error = None
+            plotlabel = 'Local sidereal time (h)'
         elif label == 'hour angle':
-            print("WARNING: parameter {0} not yet implemented".format(label))
+            data = self.hourangle
+            error = None
+            plotlabel = 'Hour angle (h)'
         elif label == 'para. angle':
-            print("WARNING: parameter {0} not yet implemented".format(label))
+            data = self.parallacticangle
+            error = None
+            plotlabel = 'Parallactic angle (deg)'
         
         return data, error, plotlabel
 
+    def zoom_limits(self):
+        """
+        Return the START and FINISH of the zoom range (MJD). Either is None
+        when it is not in use
+
+        @return:    start, finish
+        """
+        start, finish = None, None
+        if 'START' in self.fitparams:
+            start = float(self['START'].value)
+        if 'FINISH' in self.fitparams:
+            finish = float(self['FINISH'].value)
+        return start, finish
+
+    def set_zoom_limits(self, start=None, finish=None):
+        """
+        Set the START and FINISH of the zoom range. As in tempo2, a limit is
+        in use when its fit flag is set; START and FINISH are never fitted
+
+        @param start:   START (MJD), or None to switch it off
+        @param finish:  FINISH (MJD), or None to switch it off
+        """
+        for name, value in [('START', start), ('FINISH', finish)]:
+            if name not in self:
+                print("WARNING: no {0} parameter in the model".format(name))
+                continue
+            par = getattr(self._model, name)
+            if value is not None:
+                par.value = float(value)
+            par.frozen = value is None
+        self.generate_fitparams()
+        self._changed('model', 'fitset')
+
+    def toa_range(self, start=None, finish=None):
+        """
+        Return the indices of the TOAs with start <= site arrival time <=
+        finish, in time order. Found by bisection on the time order of the
+        TOAs
+
+        @param start:   Start of the range (MJD), or None for no limit
+        @param finish:  End of the range (MJD), or None for no limit
+        """
+        lo, hi = self._store.range(start, finish)
+        return self._store.order[lo:hi]
+
+    def zoom_step(self, value, direction):
+        """
+        Move a zoom limit outwards over the next observation: return the
+        new limit halfway between that observation and the TOA beyond it, or
+        one day beyond it when it is the first/last one
+
+        @param value:       Current START (direction -1) or FINISH (+1)
+        @param direction:   -1 to move START back, +1 to move FINISH forward
+
+        @return:    The new limit, or None if there are no TOAs beyond value
+        """
+        store, epochs = self._store, self.epochs
+        smjd = store.sortedmjd
+        if direction < 0:
+            k = np.searchsorted(smjd, value, side='left')
+            if k == 0:
+                return None
+            first = store.mjd[epochs.first[epochs.epoch[store.order[k-1]]]]
+            j = np.searchsorted(smjd, first, side='left')
+            return first - 1.0 if j == 0 else 0.5 * (smjd[j-1] + first)
+        else:
+            k = np.searchsorted(smjd, value, side='right')
+            if k == store.ntoas:
+                return None
+            last = store.mjd[epochs.last[epochs.epoch[store.order[k]]]]
+            j = np.searchsorted(smjd, last, side='right')
+            return last + 1.0 if j == store.ntoas else 0.5 * (last + smjd[j])
+
     def mask(self, mtype='plot', flagID=None, flagVal=None):
         """
         Returns a mask of TOAs, depending on what is requestion by mtype
@@ -403,22 +1034,17 @@ class Pulsar(object):
         @param flagID:  If set, only give mask for a given flag (+flagVal)
         @param flagVal: If set, only give mask for a given flag (+flagID)
         """
+        # TOAs within the zoom range, by bisection
+        inrange = np.zeros(self._store.ntoas, dtype=bool)
+        inrange[self.toa_range(*self.zoom_limits())] = True
+
         if mtype == 'deleted':
             msk = self.deleted
-        elif mtype in ['range', 'plot']:
-            if mtype == 'range':
-                msk = np.ones(len(self.stoas), dtype=np.bool)
-            elif mtype == 'plot':
-                msk = np.logical_not(self.deleted)
-            if 'START' in self.fitparams:
-                msk[self.stoas < self['START'].quantity] = False
-            if 'FINISH' in self.fitparams:
-                msk[self.stoas > self['FINISH'].quantity] = False
+        elif mtype == 'range':
+            msk = inrange
+        elif mtype == 'plot':
+            msk = np.logical_and(inrange, np.logical_not(self._deleted))
         elif mtype=='noplot':
-            msk = self.deleted
-            if 'START' in self.fitparams:
-                msk[self.stoas < self['START'].quantity] = True
-            if 'FINISH' in self.fitparams:
-                msk[self.stoas > self['FINISH'].val] = True
+            msk = np.logical_or(self.deleted, np.logical_not(inrange))
         
         return msk
@@ -31,6 +31,7 @@ import qtipint.constants as constants
 from qtipint.opensomething import OpenSomethingWidget
 from qtipint.plk import PlkWidget
 from qtipint.paredit import ParWidget
+from qtipint.loader import PulsarLoader
 
 from astropy import log
 log.setLevel('WARNING')
@@ -78,6 +79,11 @@ class QtipWindow(QtGui.QMainWindow):
         super(QtipWindow, self).__init__(parent)
         self.setWindowTitle('QtIpython interface to PINT/libstempo')
 
+        # The worker thread that is loading a pulsar, if any. Cancelled
+        # loaders are kept alive here until their thread has finished
+        self.pulsarLoader = None
+        self.cancelledLoaders = []
+
         # Initialise basic gui elements
         self.initUI()
 
@@ -446,19 +452,55 @@ class QtipWindow(QtGui.QMainWindow):
 
     def openPlkPulsar(self, parfilename, timfilename, testpulsar=False):
         """
-        Open a pulsar, given a parfile and a timfile
+        Open a pulsar, given a parfile and a timfile. The pulsar is loaded in
+        a worker thread, and a load that is still in progress is cancelled
 
         @param parfilename: The name of the parfile to open
         @param timfilename: The name fo the timfile to open
         @param testpulsar:  If True, open the test pulsar (J1744, NANOGrav)
         """
+        if self.pulsarLoader is not None:
+            self.pulsarLoader.cancel()
+            self.cancelledLoaders.append(self.pulsarLoader)
 
         if not testpulsar:
-            cell = "psr = pu.Pulsar('"+parfilename+"', '"+timfilename+"')"
-        else:
-            cell = "psr = pu.Pulsar(testpulsar=True)"
-        result = self.kernel.shell.run_cell(cell)
-        psr = self.kernel.shell.ns_table['user_local']['psr']
+            parfilename, timfilename = str(parfilename), str(timfilename)
+
+        self.pulsarLoader = PulsarLoader(parfilename, timfilename, \
+                testpulsar=testpulsar, parent=self)
+        self.pulsarLoader.progress.connect(self.pulsarLoadProgress)
+        self.pulsarLoader.loaded.connect(self.pulsarLoaded)
+        self.pulsarLoader.failed.connect(self.pulsarLoadFailed)
+        self.pulsarLoader.finished.connect(self.pulsarLoaderFinished)
+        self.pulsarLoader.start()
+
+    def pulsarLoadProgress(self, message, percent):
+        """
+        Show the progress of the pulsar that is being loaded in the status bar
+        """
+        if self.sender() is self.pulsarLoader:
+            self.theStatusBar.showMessage("%s... (%d%%)" % (message, percent))
+
+    def pulsarLoadFailed(self, message):
+        """
+        Loading the pulsar raised an exception
+        """
+        if self.sender() is self.pulsarLoader:
+            self.theStatusBar.showMessage("Loading pulsar failed: %s" % message)
+
+    def pulsarLoaded(self, psr):
+        """
+        The worker thread has loaded a pulsar. Hand it to the kernel and the
+        widgets
+
+        @param psr:     The loaded Pulsar object
+        """
+        if self.sender() is not self.pulsarLoader:
+            return
+        self.theStatusBar.showMessage("Loaded pulsar %s" % psr.name, 5000)
+
+        # Communicating with the kernel goes as follows
+        self.kernel.shell.push({'psr': psr}, interactive=True)
 
         # Update the plk widget
         self.plkWidget.setPulsar(psr)
@@ -466,9 +508,16 @@ class QtipWindow(QtGui.QMainWindow):
         # Update the par edit widget
         self.parEditWidget.setPulsar(psr)
 
-        # Communicating with the kernel goes as follows
-        # self.kernel.shell.push({'foo': 43, 'print_process_id': print_process_id}, interactive=True)
-        # print("Embedded, we have:", self.kernel.shell.ns_table['user_local']['foo'])
+    def pulsarLoaderFinished(self):
+        """
+        A loader thread has finished. Release it
+        """
+        loader = self.sender()
+        if loader is self.pulsarLoader:
+            self.pulsarLoader = None
+        elif loader in self.cancelledLoaders:
+            self.cancelledLoaders.remove(loader)
+        loader.deleteLater()
 
     def keyPressEvent(self, event, **kwargs):
         """
@@ -520,8 +569,14 @@ class QtipWindow(QtGui.QMainWindow):
         # TODO: Do more than just update the plot, but also update _all_ the
         # widgets. Make a callback in plkWidget for that. QtipWindow might also
         # want to loop over some stuff.
+        # The cell may have changed the pulsar directly. Subscribers (the plot
+        # and the par table) are notified of what changed
+        psr = self.plkWidget.psr
+        if psr is not None:
+            psr.check_for_changes()
+        # The redraw is skipped when the cell did not change the pulsar
         if self.whichWidget == 'plk':
-            self.plkWidget.updatePlot()
+            self.plkWidget.scheduleRedraw()
         
 def main():
     # The option parser
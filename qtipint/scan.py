@@ -0,0 +1,260 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+scan: Parallel fits over sets of candidate timing parameters
+
+Every candidate fit is independent, so they are spread over a process pool.
+The TOAs are large, and pickling them for every task would cost more than the
+fit itself. Instead, they are put in module globals before the pool is
+created: forked workers inherit them, and a task only carries the name of its
+candidate. Forking a process with other threads running (the GUI) is not
+safe, so there the workers are started fresh, and are sent the shared data
+once each when they start.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+import copy
+import multiprocessing
+
+# Numpy etc.
+import numpy as np
+import scipy.stats
+import astropy.units as u
+
+from fitting import IncrementalFitter
+
+
+# Data shared with the worker processes. Set by _share before forking
+_shared = {}
+
+def _share(fitter, gapindex=None):
+    """
+    Make the data of a fitter available to (forked) worker processes. The
+    workers start from its current post-fit model
+
+    @param gapindex:    For phase connection, the number of gaps before
+                        every TOA
+    """
+    # Copies, so a scan in a worker thread does not see later fits
+    _shared.clear()
+    _shared.update(toas=fitter.toas, model=copy.deepcopy(fitter.model), \
+            deleted=fitter.deleted.copy(), mode=fitter.mode, \
+            offsets=fitter.pulse_offsets.copy(), gapindex=gapindex)
+
+def _init_worker(shared):
+    """
+    Initialise a worker process that was not forked with the shared data
+    """
+    _shared.clear()
+    _shared.update(shared)
+
+def _fit(extra, maxiter, fixed=(), jumps=None):
+    """
+    Fit the shared model, with the parameters in extra switched on as well,
+    and the parameters in fixed set to a value and not fitted for
+
+    @param extra:   Tuple of names of parameters to fit in addition
+    @param maxiter: Maximum number of fit iterations
+    @param fixed:   Tuple of (name, value) of parameters to hold fixed
+    @param jumps:   Tuple of extra phase jumps at the shared gaps, or None
+
+    @return:    (extra, chi2, nfit), with chi2 NaN when the fit failed
+    """
+    model = copy.deepcopy(_shared['model'])
+    for par in extra:
+        getattr(model, par).frozen = False
+    for par, value in fixed:
+        getattr(model, par).value = value
+        getattr(model, par).frozen = True
+    try:
+        fitter = IncrementalFitter(_shared['toas'], model)
+        fitter.set_deleted(_shared['deleted'])
+        fitter.set_mode(_shared['mode'])
+        offsets = _shared['offsets']
+        if jumps is not None:
+            cumjumps = np.concatenate([[0], np.cumsum(jumps)])
+            offsets = offsets + cumjumps[_shared['gapindex']]
+        fitter.set_pulse_offsets(offsets)
+        chi2 = fitter.fit_toas(maxiter=maxiter)
+        nfit = len(fitter.fitparams) + 1
+    except Exception as err:
+        print("WARNING: fit with {0} failed: {1}".format(', '.join(extra), err))
+        chi2, nfit = np.nan, 0
+    return extra, chi2, nfit
+
+def _fit_star(args):
+    return _fit(*args)
+
+def map_fits(tasks, processes=None, progress=None, fork=True):
+    """
+    Run _fit for all (extra, maxiter) tasks, over a pool of processes where
+    possible, serially otherwise. The shared data must be set
+
+    @param tasks:       List of (extra, maxiter[, fixed[, jumps]]) tuples
+    @param processes:   Number of worker processes (default: all cores)
+    @param progress:    If set, called as progress(ndone, ntasks) whenever a
+                        fit has finished
+    @param fork:        Whether the workers may be forked. Set to False when
+                        other threads are running
+
+    @return:    List of _fit results, in the order of tasks
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(tasks))
+
+    pool = None
+    if processes > 1 and hasattr(multiprocessing, 'get_context'):
+        methods = multiprocessing.get_all_start_methods()
+        if fork and 'fork' in methods:
+            # Forked workers inherit the shared data
+            pool = multiprocessing.get_context('fork').Pool(processes)
+        else:
+            method = 'forkserver' if 'forkserver' in methods else 'spawn'
+            pool = multiprocessing.get_context(method).Pool(processes, \
+                    initializer=_init_worker, initargs=(dict(_shared),))
+
+    results = []
+    try:
+        fits = map(_fit_star, tasks) if pool is None else \
+                pool.imap(_fit_star, tasks, chunksize=1)
+        for result in fits:
+            results.append(result)
+            if progress is not None:
+                progress(len(results), len(tasks))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results
+
+def linearised_chi2(fitter, X, Y, r):
+    """
+    Express the chi^2 of the residuals r + Y n, after fitting for the columns
+    of X, as a quadratic form a + 2 b.n + n^T Q n in n. The covariance of the
+    fitter is used
+
+    @param fitter:  The IncrementalFitter
+    @param X:       (ntoas, nfit) design matrix of the fitted parameters
+    @param Y:       (ntoas, k) matrix of the effect of n on the residuals
+    @param r:       The residuals (s)
+
+    @return:    a, b, Q
+    """
+    CinvY, Cinvr = fitter.cinv(Y), fitter.cinv(r)
+    XCX = np.dot(X.T, fitter.cinv(X))
+    XCY, XCr = np.dot(X.T, CinvY), np.dot(X.T, Cinvr)
+    KY = np.linalg.lstsq(XCX, XCY, rcond=None)[0]
+    Kr = np.linalg.lstsq(XCX, XCr, rcond=None)[0]
+    Q = np.dot(Y.T, CinvY) - np.dot(XCY.T, KY)
+    b = np.dot(Y.T, Cinvr) - np.dot(XCY.T, Kr)
+    a = np.dot(r, Cinvr) - np.dot(XCr, Kr)
+    return a, b, Q
+
+def ftest_scan(psr, candidates=None, processes=None, maxiter=1, progress=None, \
+        fork=True):
+    """
+    For every candidate parameter, fit the current fit set plus that
+    parameter, and compare with the fit of the current fit set with an F-test
+
+    @param psr:         The Pulsar object
+    @param candidates:  Names of parameters to try (default: all fittable
+                        timing parameters that are not fitted for)
+    @param processes:   Number of worker processes (default: all cores)
+    @param maxiter:     Maximum number of iterations of every fit
+    @param progress:    Progress callback, see map_fits
+    @param fork:        Whether the workers may be forked, see map_fits
+
+    @return:    List of (parameter, delta chi2, F, p-value), sorted by
+                p-value. delta chi2 is the decrease of chi2 by adding the
+                parameter
+    """
+    fitter = psr._fitter
+    if candidates is None:
+        candidates = psr.fittable_params()
+    candidates = sorted(set(candidates) - set(psr.fitparams))
+
+    # Start from the current post-fit model, with the current fit flags
+    _share(fitter)
+    tasks = [((), maxiter)] + [((par,), maxiter) for par in candidates]
+    results = map_fits(tasks, processes, progress=progress, fork=fork)
+
+    chi2_0 = results[0][1]
+    ntoas = fitter.ntoas
+    table = []
+    for extra, chi2, nfit in results[1:]:
+        dof = ntoas - nfit
+        dchi2 = chi2_0 - chi2
+        if np.isfinite(chi2) and dof > 0 and chi2 > 0:
+            F = dchi2 / (chi2 / dof)
+            pval = scipy.stats.f.sf(F, 1, dof)
+        else:
+            F, pval = np.nan, np.nan
+        table.append((extra[0], dchi2, F, pval))
+
+    table.sort(key=lambda row: (np.isnan(row[3]), row[3]))
+    return table
+
+def grid_scan(psr, params, grids, method='auto', nsigma=3.0, processes=None, \
+        maxiter=1, progress=None, fork=True):
+    """
+    Map chi^2 over a grid of values of one or two parameters. At every grid
+    point, the scanned parameters are held fixed and the other fitted
+    parameters are fitted for.
+
+    Near the current solution, chi^2 is a quadratic form in the offsets of
+    the scanned parameters, after projecting out the other parameters with
+    the design matrix. That is evaluated for the whole grid at once. When the
+    grid reaches further than nsigma (linearised) uncertainties, every grid
+    point is fitted with the full nonlinear model, in a process pool.
+
+    @param psr:         The Pulsar object
+    @param params:      Names of the one or two parameters to scan
+    @param grids:       One array of values (in parameter units) per parameter
+    @param method:      'linear', 'full', or 'auto' (choose by nsigma)
+    @param nsigma:      Largest offset, in uncertainties, for the linear path
+    @param processes:   Number of worker processes (default: all cores)
+    @param maxiter:     Maximum number of iterations of every full fit
+    @param progress:    Progress callback, see map_fits
+    @param fork:        Whether the workers may be forked, see map_fits
+
+    @return:    chi2 array, with chi2[i, j] at grids[0][i], grids[1][j]
+    """
+    params = list(params)
+    if not 1 <= len(params) <= 2 or len(grids) != len(params):
+        raise ValueError("Need one grid for each of one or two parameters")
+    if method not in ['auto', 'linear', 'full']:
+        raise ValueError("Value {0} not a valid option for method".format(method))
+
+    fitter = psr._fitter
+    model = fitter.model
+    grids = [np.asarray(g, dtype=np.float64) for g in grids]
+    shape = tuple(len(g) for g in grids)
+
+    # Offsets of the grid points from the current solution
+    current = [getattr(model, p).value for p in params]
+    offsets = np.meshgrid(*[g - np.float64(c) for g, c in zip(grids, current)], \
+            indexing='ij')
+    D = np.column_stack([off.ravel() for off in offsets])
+
+    # Linearised chi^2 with the other parameters projected out
+    others = [p for p in fitter.fitparams if p not in params]
+    M, names, units = fitter.dmcache.designmatrix(model, others + params)
+    X, S = M[:,:len(others)+1], M[:,len(others)+1:]
+    a, b, Q = linearised_chi2(fitter, X, -S, fitter.residuals())
+    sigma = np.sqrt(np.diag(np.linalg.pinv(Q)))
+
+    if method == 'linear' or (method == 'auto' and \
+            np.all(np.abs(D) <= nsigma * sigma)):
+        chi2 = a + 2 * np.dot(D, b) + np.einsum('ij,jk,ik->i', D, Q, D)
+        return chi2.reshape(shape)
+
+    _share(fitter)
+    values = np.meshgrid(*grids, indexing='ij')
+    tasks = [((), maxiter, tuple(zip(params, point))) for point in \
+            zip(*[val.ravel() for val in values])]
+    results = map_fits(tasks, processes, progress=progress, fork=fork)
+    return np.array([chi2 for extra, chi2, nfit in results]).reshape(shape)
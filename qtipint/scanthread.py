@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+scanthread: Run fit scans in a worker thread, so the Qt event loop keeps
+running
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+import traceback
+
+from qtconsole.qt import QtCore
+
+
+class ScanThread(QtCore.QThread):
+    """
+    Worker thread that runs a scan of a pulsar (Pulsar.ftest_scan or
+    Pulsar.grid_scan). Progress, the result, and failures are reported
+    through signals, which Qt delivers in the thread of the receiver.
+
+    The scan is told not to fork its worker processes: forking a process with
+    several threads running is not safe
+    """
+    progress = QtCore.Signal(int, int)
+    done = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+
+    def __init__(self, scan, parent=None, **kwargs):
+        """
+        @param scan:    The scan method to call
+        @param parent:  Parent QObject
+        @param kwargs:  Arguments of the scan
+        """
+        super(ScanThread, self).__init__(parent)
+
+        self.scan = scan
+        self.kwargs = kwargs
+
+    def reportProgress(self, ndone, ntotal):
+        """
+        Progress callback, called by the scan when a fit has finished
+        """
+        self.progress.emit(ndone, ntotal)
+
+    def run(self):
+        try:
+            result = self.scan(progress=self.reportProgress, fork=False, \
+                    **self.kwargs)
+        except Exception as err:
+            traceback.print_exc()
+            self.failed.emit(str(err))
+            return
+
+        self.done.emit(result)
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+skyaxes: Local sidereal time, hour angle, elevation and parallactic angle of
+the pulsar at every TOA
+
+Converting every TOA with astropy coordinate frames is far too slow for large
+TOA sets, and these are only plot axes. Instead, the observatory longitude and
+latitude are looked up once per observatory code, and the angles of all TOAs
+follow from a few numpy expressions: the mean sidereal time of the IAU 1982
+model, and spherical trigonometry. The site arrival times (UTC) stand in for
+UT1, and the J2000 position of the pulsar is not precessed; both errors are a
+small fraction of a degree.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Numpy etc.
+import numpy as np
+import astropy.units as u
+import astropy.coordinates as coord
+
+import pint.observatory
+
+
+def gmst(mjd):
+    """
+    Greenwich mean sidereal time (IAU 1982)
+
+    @param mjd:     Times (MJD, UT1)
+
+    @return:    GMST (hours, 0 to 24)
+    """
+    d = np.asarray(mjd, dtype=np.float64) - 51544.5
+    T = d / 36525.0
+    deg = 280.46061837 + 360.98564736629 * d + \
+            0.000387933 * T**2 - T**3 / 38710000.0
+    return np.mod(deg, 360.0) / 15.0
+
+def observatory_location(code):
+    """
+    Return the geodetic longitude and latitude of an observatory
+
+    @param code:    Observatory code or name, as in the TOAs
+
+    @return:    longitude, latitude (deg, east positive), or NaNs for
+                observatories that are not on the Earth's surface
+    """
+    try:
+        obs = pint.observatory.Observatory.get(code)
+    except KeyError:
+        print("WARNING: unknown observatory {0}".format(code))
+        return np.nan, np.nan
+
+    if hasattr(obs, 'earth_location_itrf'):
+        loc = obs.earth_location_itrf()
+    else:
+        loc = getattr(obs, 'earth_location', None)
+    if loc is None or np.all(u.Quantity(loc.geocentric).value == 0):
+        # Barycentre, geocentre, spacecraft
+        return np.nan, np.nan
+
+    return loc.lon.to(u.deg).value, loc.lat.to(u.deg).value
+
+def pulsar_position(model):
+    """
+    Return the J2000 right ascension and declination of the pulsar
+
+    @param model:   The PINT timing model
+
+    @return:    ra, dec (rad)
+    """
+    if 'RAJ' in model.params and 'DECJ' in model.params:
+        ra = model.RAJ.quantity.to(u.rad).value
+        dec = model.DECJ.quantity.to(u.rad).value
+    elif 'ELONG' in model.params and 'ELAT' in model.params:
+        ecl = coord.SkyCoord(lon=model.ELONG.quantity, lat=model.ELAT.quantity, \
+                frame=coord.BarycentricTrueEcliptic)
+        icrs = ecl.transform_to(coord.ICRS)
+        ra, dec = icrs.ra.to(u.rad).value, icrs.dec.to(u.rad).value
+    else:
+        raise ValueError("Timing model has no pulsar position")
+    return float(ra), float(dec)
+
+def sky_axes(mjd, obs, ra, dec):
+    """
+    Compute the sidereal time, hour angle, elevation and parallactic angle of
+    the pulsar for all TOAs
+
+    @param mjd:     Site arrival times (MJD, UTC)
+    @param obs:     Observatory code of every TOA
+    @param ra:      Right ascension of the pulsar (rad)
+    @param dec:     Declination of the pulsar (rad)
+
+    @return:    Dictionary of arrays: 'sidereal time' (hours, 0 to 24),
+                'hour angle' (hours, -12 to 12), 'elevation' (deg) and
+                'para. angle' (deg, -180 to 180). NaN for TOAs not taken at
+                a ground-based observatory
+    """
+    codes, obsindex = np.unique(np.asarray(obs), return_inverse=True)
+    locs = np.array([observatory_location(code) for code in codes], \
+            dtype=np.float64).reshape(-1, 2)
+    lon, lat = locs[obsindex,0], np.radians(locs[obsindex,1])
+
+    lst = np.mod(gmst(mjd) + lon / 15.0, 24.0)
+    ha = np.mod(lst - np.degrees(ra) / 15.0 + 12.0, 24.0) - 12.0
+    H = ha * (np.pi / 12.0)
+
+    sinel = np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(H)
+    el = np.arcsin(np.clip(sinel, -1.0, 1.0))
+    pa = np.arctan2(np.sin(H), \
+            np.tan(lat) * np.cos(dec) - np.sin(dec) * np.cos(H))
+
+    return {'sidereal time': lst, 'hour angle': ha, \
+            'elevation': np.degrees(el), 'para. angle': np.degrees(pa)}
@@ -0,0 +1,333 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+toacache: Persistent on-disk cache of processed PINT TOAs
+
+Reading a tim-file with PINT means parsing it, applying the clock corrections,
+converting to TDB and computing the observatory positions and velocities. For
+large datasets that takes minutes, and it is redone every time a pulsar is
+opened. This module stores the fully processed TOA table on disk, keyed by the
+content of everything that went into it:
+
+- the bytes of the tim-file and of all the files it INCLUDEs
+- the clock files that PINT may use (name, size and modification time)
+- the keyword arguments passed to get_TOAs (ephemeris, planets, ...)
+- which processing stages apply: like pint.toa.get_TOAs, clock corrections
+  are skipped for TOAs that carry 'clkcorr' flags already
+- the PINT version and the cache layout version
+
+Every numeric column of the table is written as a separate .npy file, and
+memory-mapped (copy-on-write) when the entry is loaded again. The rest of the
+TOAs object (object columns, flags, table groups) is pickled. The cache is
+limited in total size and number of entries, and the least recently used
+entries are evicted first.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+import hashlib
+import pickle
+import shutil
+import copy
+
+# Numpy etc.
+import numpy as np
+from astropy import table
+from astropy.table.groups import TableGroups
+
+import pint
+from pint import toa
+
+# Bump this when the layout or the processing of a cache entry changes
+CACHE_VERSION = 2
+
+# Default location and limits of the cache
+default_cachedir = os.environ.get('QTIPINT_CACHE', \
+        os.path.join(os.path.expanduser('~'), '.qtipint', 'toacache'))
+default_maxbytes = 2 * 1024**3
+default_maxentries = 32
+
+# Name of the pickled part of a cache entry. Its mtime is the LRU timestamp
+_metaname = 'toas.pickle'
+
+
+def _include_files(timfile):
+    """
+    Return the list of files that are read when reading timfile, including
+    timfile itself, in the order in which they are encountered
+
+    @param timfile: The tim-file to scan for INCLUDE commands
+    """
+    files, todo = [], [timfile]
+    while len(todo) > 0:
+        fname = todo.pop(0)
+        if fname in files:
+            continue
+        files.append(fname)
+
+        try:
+            fin = open(fname, 'r')
+        except IOError:
+            continue
+
+        for line in fin:
+            tokens = line.split()
+            if len(tokens) > 1 and tokens[0].upper() == 'INCLUDE':
+                incfile = tokens[1]
+                local = os.path.join(os.path.dirname(fname), incfile)
+                if not os.path.isabs(incfile) and os.path.exists(local):
+                    incfile = local
+                todo.append(incfile)
+        fin.close()
+
+    return files
+
+def _clock_dirs():
+    """
+    Return the directories that PINT searches for clock correction files
+    """
+    dirs = [os.path.join(os.path.dirname(pint.__file__), 'datafiles')]
+    for env in ['TEMPO', 'TEMPO2']:
+        if env in os.environ:
+            dirs.append(os.path.join(os.environ[env], 'clock'))
+    return dirs
+
+def cache_key(timfile, **kwargs):
+    """
+    Compute the content-addressed key of a tim-file
+
+    @param timfile: The tim-file that will be read
+    @param kwargs:  Keyword arguments that will be passed to get_TOAs
+
+    @return:    Hexadecimal digest that identifies the processed TOAs
+    """
+    h = hashlib.sha1()
+    h.update(repr((CACHE_VERSION, getattr(pint, '__version__', None), \
+            np.dtype(np.longdouble).str, sorted(kwargs.items()))).encode())
+
+    clkcorr = False
+    for fname in _include_files(timfile):
+        h.update(os.path.basename(fname).encode())
+        if os.path.exists(fname):
+            fin = open(fname, 'rb')
+            data = fin.read()
+            fin.close()
+            h.update(data)
+            clkcorr = clkcorr or b'-clkcorr' in data
+    h.update(repr(('clkcorr', clkcorr)).encode())
+
+    for cdir in _clock_dirs():
+        if not os.path.isdir(cdir):
+            continue
+        for fname in sorted(os.listdir(cdir)):
+            st = os.stat(os.path.join(cdir, fname))
+            h.update(repr((fname, st.st_size, int(st.st_mtime))).encode())
+
+    return h.hexdigest()
+
+def _entry_size(entrydir):
+    return sum(os.path.getsize(os.path.join(entrydir, f)) \
+            for f in os.listdir(entrydir))
+
+def _save_entry(toas, entrydir):
+    """
+    Write a processed TOAs object to a new cache entry
+
+    @param toas:        The TOAs object, with TDBs and posvels computed
+    @param entrydir:    The directory of the cache entry
+    """
+    tab = toas.table
+    tmpdir = '%s.tmp%d' % (entrydir, os.getpid())
+    if os.path.exists(tmpdir):
+        shutil.rmtree(tmpdir)
+    os.makedirs(tmpdir)
+
+    numeric, objcols = {}, {}
+    for name in tab.colnames:
+        col = tab[name]
+        if isinstance(col, table.Column) and col.dtype.kind in 'biuf':
+            np.save(os.path.join(tmpdir, name + '.npy'), \
+                    np.ascontiguousarray(col.data))
+            numeric[name] = dict(unit=col.unit, description=col.description, \
+                    format=col.format)
+        else:
+            objcols[name] = col
+
+    # The groups of the table (PINT groups by observatory)
+    if tab.groups.keys is not None:
+        groups = (np.array(tab.groups.indices), tab.groups.keys)
+    else:
+        groups = None
+
+    skeleton = copy.copy(toas)
+    skeleton.table = None
+
+    fout = open(os.path.join(tmpdir, _metaname), 'wb')
+    pickle.dump(dict(toas=skeleton, colnames=tab.colnames, numeric=numeric, \
+            objcols=objcols, meta=tab.meta, groups=groups), fout, \
+            protocol=pickle.HIGHEST_PROTOCOL)
+    fout.close()
+
+    try:
+        os.rename(tmpdir, entrydir)
+    except OSError:
+        # Somebody else wrote the same entry in the meantime
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+def _load_entry(entrydir):
+    """
+    Load a TOAs object from a cache entry, memory-mapping the numeric columns
+
+    @param entrydir:    The directory of the cache entry
+
+    @return:    The TOAs object
+    """
+    fin = open(os.path.join(entrydir, _metaname), 'rb')
+    entry = pickle.load(fin)
+    fin.close()
+
+    columns = []
+    for name in entry['colnames']:
+        if name in entry['numeric']:
+            data = np.load(os.path.join(entrydir, name + '.npy'), mmap_mode='c')
+            columns.append(table.Column(data, name=name, copy=False, \
+                    **entry['numeric'][name]))
+        else:
+            columns.append(entry['objcols'][name])
+
+    tab = table.Table(columns, names=entry['colnames'], meta=entry['meta'], \
+            copy=False)
+    if entry['groups'] is not None:
+        indices, keys = entry['groups']
+        tab._groups = TableGroups(tab, indices=indices, keys=keys)
+
+    toas = entry['toas']
+    toas.table = tab
+
+    # Mark this entry as most recently used
+    os.utime(os.path.join(entrydir, _metaname), None)
+    return toas
+
+def evict(cachedir=None, maxbytes=default_maxbytes, \
+        maxentries=default_maxentries, keep=None):
+    """
+    Remove least recently used entries until the cache is within its limits
+
+    @param cachedir:    The cache directory
+    @param maxbytes:    Maximum total size of the cache in bytes
+    @param maxentries:  Maximum number of entries in the cache
+    @param keep:        Key of an entry that should never be evicted
+    """
+    cachedir = default_cachedir if cachedir is None else cachedir
+    if not os.path.isdir(cachedir):
+        return
+
+    entries = []
+    for key in os.listdir(cachedir):
+        metafile = os.path.join(cachedir, key, _metaname)
+        if os.path.exists(metafile):
+            entrydir = os.path.join(cachedir, key)
+            entries.append((os.path.getmtime(metafile), key, \
+                    _entry_size(entrydir)))
+
+    # Oldest first
+    entries.sort()
+    total = sum(e[2] for e in entries)
+    nentries = len(entries)
+    for atime, key, size in entries:
+        if total <= maxbytes and nentries <= maxentries:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(os.path.join(cachedir, key), ignore_errors=True)
+        total -= size
+        nentries -= 1
+
+def clear(cachedir=None):
+    """
+    Remove all entries from the cache
+
+    @param cachedir:    The cache directory
+    """
+    cachedir = default_cachedir if cachedir is None else cachedir
+    if os.path.isdir(cachedir):
+        shutil.rmtree(cachedir, ignore_errors=True)
+
+def _process_TOAs(timfile, progress=None, ephem='DE421', include_bipm=True, \
+        include_gps=True, planets=False):
+    """
+    Read and process the TOAs of a tim-file, the same way pint.toa.get_TOAs
+    does, but reporting progress between the stages. As there, TOAs with
+    'clkcorr' flags are not clock corrected again, and TDBs and posvels are
+    only computed when the table does not have them yet
+
+    @param timfile:     The tim-file to read
+    @param progress:    Callback function, called with the name of each stage
+    """
+    if progress is not None:
+        progress('toas')
+    toas = toa.TOAs(timfile)
+
+    if progress is not None:
+        progress('clock')
+    if not any(['clkcorr' in flags for flags in toas.table['flags']]):
+        toas.apply_clock_corrections(include_gps=include_gps, \
+                include_bipm=include_bipm)
+    if 'tdb' not in toas.table.colnames:
+        toas.compute_TDBs()
+    if 'ssb_obs_pos' not in toas.table.colnames:
+        toas.compute_posvels(ephem, planets)
+
+    return toas
+
+def get_TOAs(timfile, usecache=True, cachedir=None, \
+        maxbytes=default_maxbytes, maxentries=default_maxentries, \
+        progress=None, **kwargs):
+    """
+    Read the TOAs of a tim-file, re-using the processed TOAs from the cache if
+    nothing that went into them has changed. Drop-in replacement for
+    pint.toa.get_TOAs
+
+    @param timfile:     The tim-file to read
+    @param usecache:    If False, bypass the cache altogether
+    @param cachedir:    The cache directory
+    @param maxbytes:    Maximum total size of the cache in bytes
+    @param maxentries:  Maximum number of entries in the cache
+    @param progress:    Callback function, called with the name of each stage
+                        ('toas', 'clock'). It may raise to abort reading
+    @param kwargs:      ephem, include_bipm, include_gps, planets, as for
+                        pint.toa.get_TOAs
+
+    @return:    The TOAs object
+    """
+    if not usecache:
+        return _process_TOAs(timfile, progress=progress, **kwargs)
+
+    cachedir = default_cachedir if cachedir is None else cachedir
+    key = cache_key(timfile, **kwargs)
+    entrydir = os.path.join(cachedir, key)
+
+    if os.path.exists(os.path.join(entrydir, _metaname)):
+        if progress is not None:
+            progress('toas')
+        try:
+            toas = _load_entry(entrydir)
+            print("Loaded TOAs of %s from cache" % timfile)
+            return toas
+        except Exception as err:
+            print("WARNING: TOA cache entry %s unreadable (%s)" % (key, err))
+            shutil.rmtree(entrydir, ignore_errors=True)
+
+    toas = _process_TOAs(timfile, progress=progress, **kwargs)
+
+    try:
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        _save_entry(toas, entrydir)
+        evict(cachedir, maxbytes=maxbytes, maxentries=maxentries, keep=key)
+    except (IOError, OSError, pickle.PicklingError) as err:
+        print("WARNING: could not write TOA cache entry (%s)" % err)
+
+    return toas
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# vim: tabstop=4:softtabstop=4:shiftwidth=4:expandtab
+"""
+toastore: Columnar store of the per-TOA quantities of a PINT TOAs object
+
+The astropy table of PINT is convenient, but slow to access element-wise, and
+getting a column out of it as a Quantity allocates every time. The plotting
+code needs these arrays many times per redraw, so we extract them once per TOA
+set into contiguous, read-only numpy arrays. Pulsar hands out views on these.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+# Numpy etc.
+import numpy as np
+import astropy.units as u
+
+
+def _readonly(arr, dtype):
+    """
+    Return a contiguous, read-only copy of arr with the given dtype
+    """
+    arr = np.array(arr, dtype=dtype, order='C')
+    arr.flags.writeable = False
+    return arr
+
+class TOAStore(object):
+    """
+    Contiguous arrays of the site arrival times (MJD, float64), barycentric
+    arrival times (TDB MJD, longdouble), observing frequencies (MHz), TOA
+    uncertainties (us), observatories and flags of a TOA set, and the time
+    order of the TOAs
+    """
+
+    def __init__(self, toas):
+        """
+        @param toas:    The PINT TOAs object
+        """
+        tab = toas.table
+
+        self.ntoas = len(tab)
+        self.mjd = _readonly(toas.get_mjds().to(u.d).value, np.float64)
+        self.tdb = _readonly(tab['tdbld'], np.longdouble)
+        self.freq = _readonly(tab['freq'].quantity.to(u.MHz).value, np.float64)
+        self.error = _readonly(toas.get_errors().to(u.us).value, np.float64)
+        self.obs = _readonly([str(o) for o in tab['obs']], str)
+
+        # Time order of the TOAs, for range queries by bisection
+        self.order = _readonly(np.argsort(self.mjd, kind='mergesort'), np.int64)
+        self.sortedmjd = _readonly(self.mjd[self.order], np.float64)
+
+        # One array of strings per flag. TOAs without the flag get ''
+        flagdicts = list(tab['flags'])
+        names = set()
+        for fd in flagdicts:
+            names.update(fd.keys())
+        self.flags = {}
+        for name in names:
+            self.flags[name] = _readonly([str(fd.get(name, '')) \
+                    for fd in flagdicts], object)
+
+    def flagvalues(self, flagID):
+        """
+        Return the values of a flag for all TOAs ('' where it is not set)
+
+        @param flagID:  The name of the flag, without the dash
+        """
+        if flagID in self.flags:
+            return self.flags[flagID]
+        return _readonly(np.full(self.ntoas, '', dtype=object), object)
+
+    def range(self, start=None, finish=None):
+        """
+        Return the positions in order of the first TOA at or after start, and
+        of the first TOA after finish. The TOAs in the range are
+        order[lo:hi]
+
+        @param start:   Start of the range (MJD), or None for no limit
+        @param finish:  End of the range (MJD), or None for no limit
+
+        @return:    lo, hi
+        """
+        lo = 0 if start is None else \
+                int(np.searchsorted(self.sortedmjd, start, side='left'))
+        hi = self.ntoas if finish is None else \
+                int(np.searchsorted(self.sortedmjd, finish, side='right'))
+        return lo, max(lo, hi)
+
+    @staticmethod
+    def view(arr, unit):
+        """
+        Return a Quantity that shares its memory with arr
+        """
+        return u.Quantity(arr, unit, copy=False)
@@ -0,0 +1,86 @@
+"""
+Tests of the factorisation and updates of the normal equations of a fit
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'qtipint'))
+
+# Numpy etc.
+import numpy as np
+import scipy.linalg as sl
+
+import cholesky
+
+
+def _design(ntoas=200, nparams=5, seed=1):
+    rng = np.random.RandomState(seed)
+    M = rng.normal(size=(ntoas, nparams))
+    M[:,0] = 1.0
+    return M
+
+def test_downdate_equals_refactorise():
+    M = _design()
+    R = sl.cholesky(np.dot(M.T, M), lower=False)
+
+    deleted = [3, 17, 18, 150]
+    for ind in deleted:
+        R = cholesky.cholupdate(R, M[ind], -1.0)
+    keep = np.setdiff1d(np.arange(len(M)), deleted)
+    Rfresh = sl.cholesky(np.dot(M[keep].T, M[keep]), lower=False)
+    assert np.allclose(R, Rfresh)
+
+    # Restoring the TOAs gives the original factor back
+    for ind in deleted:
+        R = cholesky.cholupdate(R, M[ind], 1.0)
+    assert np.allclose(R, sl.cholesky(np.dot(M.T, M), lower=False))
+
+def test_downdate_to_singular():
+    M = _design()
+    M[:,4] = 0.0
+    M[10,4] = 1.0
+    R = sl.cholesky(np.dot(M.T, M), lower=False)
+    assert cholesky.cholupdate(R, M[10], -1.0) is None
+
+def test_factorise_regular():
+    M = _design()
+    A, b = np.dot(M.T, M), np.dot(M.T, np.arange(len(M), dtype=np.float64))
+    factor = cholesky.factorise(A)
+    assert factor[0] is not None
+    x, Ainv = cholesky.solve(factor, b)
+    assert np.allclose(x, np.linalg.solve(A, b))
+    assert np.allclose(Ainv, np.linalg.inv(A))
+    assert not np.any(cholesky.degenerate_columns(factor))
+
+def test_factorise_rank_deficient():
+    # A JUMP-like column of which all TOAs are deleted
+    M = _design()
+    M[:,3] = 0.0
+    r = np.random.RandomState(2).normal(size=len(M))
+    A, b = np.dot(M.T, M), np.dot(M.T, r)
+
+    factor = cholesky.factorise(A)
+    assert factor[0] is None
+    assert list(cholesky.degenerate_columns(factor)) == \
+            [False, False, False, True, False]
+
+    x, Ainv = cholesky.solve(factor, b)
+    cols = [0, 1, 2, 4]
+    xref = np.linalg.lstsq(M[:,cols], r, rcond=None)[0]
+    assert np.allclose(x[cols], xref)
+    assert x[3] == 0.0
+    assert np.all(Ainv[3] == 0.0) and np.all(Ainv[:,3] == 0.0)
+    assert np.allclose(Ainv[np.ix_(cols, cols)], \
+            np.linalg.inv(np.dot(M[:,cols].T, M[:,cols])))
+
+def test_factorise_collinear():
+    # Two columns that are the same up to a scale: the pseudo-inverse still
+    # gives a finite solution that fits the data
+    M = _design()
+    M[:,2] = 2.0 * M[:,1]
+    r = np.dot(M, [1.0, 0.5, 0.25, -1.0, 2.0])
+    x, Ainv = cholesky.solve(cholesky.factorise(np.dot(M.T, M)), np.dot(M.T, r))
+    assert np.all(np.isfinite(x))
+    assert np.allclose(np.dot(M, x), r)